@@ -21,10 +21,53 @@ __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
 from django.conf import settings
+from django.contrib import auth
 from django.contrib.auth.models import User
 
 from .models import *
 
+def _perm_name(perm, model):
+    if '.' in perm:
+        return perm
+    return "%s.%s" % (model._meta.app_label, perm)
+
+def get_object_perms_for(user, objects, perms):
+    """Returns which of the given perms user has on each of the given objects.
+
+    objects must be instances of the same model. perms are codenames or
+    full permission names. The result maps the pk of each object to the
+    set of perms the user has on it. Like obj_permission_required, generic
+    model permissions are valid for every object. Object permissions come
+    from the permission index of the user, so a whole page of objects is
+    resolved with at most one query.
+
+    This is the API to check permissions on a list of objects at once: it
+    takes any user, like request.user, e.g.
+
+        get_object_perms_for(request.user, page, ["change_task", "delete_task"])
+    """
+    objects = list(objects)
+    result = dict([(obj.pk, set()) for obj in objects])
+    if not objects or not perms or not user.is_active:
+        return result
+
+    model = objects[0].__class__
+    object_perms = []
+    for perm in perms:
+        if user.is_superuser or user.has_perm(_perm_name(perm, model)):
+            for found in result.values():
+                found.add(perm)
+        else:
+            object_perms.append(perm)
+
+    if object_perms:
+        for backend in auth.get_backends():
+            if hasattr(backend, 'get_object_perms_for'):
+                for pk, found in backend.get_object_perms_for(user, objects, object_perms).items():
+                    result[pk].update(found)
+
+    return result
+
 class ObjectPermissionBackend(object):
     """Backend which enables support for row-level permissions.
     """
@@ -39,21 +82,44 @@ class ObjectPermissionBackend(object):
         if not hasattr(user_obj, '_group_obj_perm_cache'):
             perms = ObjectPermission.objects.get_group_permissions(user_obj)
             perms = perms.values_list('perm__content_type__app_label', 'perm__codename', 'object_id').order_by()
-            user_obj._group_obj_perm_cache = set(["%s.%s.%s" % (ct, name, obj_id) for ct, name in perms])
+            user_obj._group_obj_perm_cache = set(["%s.%s.%s" % (ct, name, obj_id) for ct, name, obj_id in perms])
         return user_obj._group_obj_perm_cache
 
+    def get_permission_index(self, user_obj):
+        """Returns the object permission index of user_obj.
+
+        The index is shared through the cache and kept on user_obj for the
+        rest of the request.
+        """
+        if not hasattr(user_obj, '_obj_perm_index'):
+            user_obj._obj_perm_index = ObjectPermission.objects.get_index(user_obj)
+        return user_obj._obj_perm_index
+
     def get_all_permissions(self, user_obj):
-        if user_obj.is_anonymous():
+        if user_obj.is_anonymous:
             return set()
         if not hasattr(user_obj, '_obj_perm_cache'):
-            user_obj._obj_perm_cache = set([u"%s.%s.%s" % (p.perm.content_type.app_label, p.perm.codename, p.object_id) for p in user_obj.objectpermissions.all()])
-            user_obj._obj_perm_cache.update(self.get_group_permissions(user_obj))
+            user_obj._obj_perm_cache = set([u"%s.%s" % (perm, obj_id) for perm, ids in self.get_permission_index(user_obj).items() for obj_id in ids])
         return user_obj._obj_perm_cache
 
+    def get_object_perms_for(self, user_obj, objects, perms):
+        """Returns the object permissions of user_obj on the given objects.
+        """
+        if not user_obj.is_authenticated or not user_obj.is_active:
+            return {}
+        index = self.get_permission_index(user_obj)
+        result = {}
+        for perm in perms:
+            ids = index.get(_perm_name(perm, objects[0].__class__), ())
+            for obj in objects:
+                if obj.pk in ids:
+                    result.setdefault(obj.pk, set()).add(perm)
+        return result
+
     def has_perm(self, user_obj, perm, obj=None):
         """This method checks if the user_obj has perm on obj.
         """
-        if not user_obj.is_authenticated():
+        if not user_obj.is_authenticated:
             user_obj = User.objects.get(pk=settings.ANONYMOUS_USER_ID)
 
         if user_obj.is_superuser:
@@ -68,4 +134,4 @@ class ObjectPermissionBackend(object):
         if isinstance(perm, Permission):
             perm = "%s.%s" % (perm.content_type.app_label, perm.codename)
 
-        return "%s.%d" % (perm, obj.pk) in self.get_all_permissions(user_obj)
+        return obj.pk in self.get_permission_index(user_obj).get(perm, ())
@@ -20,34 +20,36 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
-# Inspired by http://stackoverflow.com/a/7469395/1063729
+from contextvars import ContextVar
 
-class _Singleton(type):
-    """Singleton pattern.
-    """
-    def __init__(cls, name, bases, dicts):
-        cls.instance = None
-
-    def __call__(cls, *args, **kwargs):
-        if cls.instance is None:
-            cls.instance = super(_Singleton, cls).__call__(*args, **kwargs)
-        return cls.instance
+_current_user = ContextVar('current_user', default=None)
 
 class LoggedInUserCache(object):
-    """Stores the current user as a member attribute of a singleton.
+    """Stores the current user in a context variable.
+
+    Every thread and every asyncio task sees its own value, so concurrent
+    requests never see each other's user. The request's user is stored as
+    is and only evaluated when current_user is read.
     """
-    __metaclass__ = _Singleton
+    def set_user(self, request):
+        """Stores the user of the given request.
 
-    user = None
+        Returns a token which can be passed to reset().
+        """
+        return _current_user.set(getattr(request, 'user', None))
 
-    def set_user(self, request):
-        if request.user.is_authenticated():
-            self.user = request.user
+    def reset(self, token):
+        """Restores the user stored before the set_user() call that returned token.
+        """
+        _current_user.reset(token)
 
     @property
     def current_user(self):
-        return self.user
+        user = _current_user.get()
+        if user is not None and user.is_authenticated:
+            return user
+        return None
 
     @property
     def has_user(self):
-        return user is not None
+        return self.current_user is not None
@@ -23,10 +23,56 @@ __version__ = '0.0.5'
 from django.utils.functional import lazy
 
 from .models import *
+from .backends import ObjectPermissionBackend
+from .registry import permissions
 
 # ObjPermWrapper and ObjPermLookupDict proxy the permissions system into objects
 # that the template system can understand.
 
+class ObjPermSet(object):
+    """Lazy set of the ids of the objects on which a user has a permission.
+
+    Membership tests never load whole tables: superusers get an indexed
+    EXISTS query on the model of the permission, other users a lookup in
+    their (cached) object permission index.
+    """
+    def __init__(self, user, app_label, codename):
+        self.user, self.app_label, self.codename = user, app_label, codename
+
+    def _model(self):
+        perm = permissions.get(self.app_label, self.codename)
+        if perm is None:
+            return None
+        return perm.content_type.model_class()
+
+    def _ids(self):
+        if not (self.user.is_authenticated and self.user.is_active):
+            return ()
+        index = ObjectPermissionBackend().get_permission_index(self.user)
+        return index.get("%s.%s" % (self.app_label, self.codename), ())
+
+    def __contains__(self, pk):
+        if pk is None:
+            return False
+        if self.user.is_superuser:
+            model = self._model()
+            return model is not None and model._default_manager.filter(pk=pk).exists()
+        return pk in self._ids()
+
+    def __iter__(self):
+        if self.user.is_superuser:
+            model = self._model()
+            if model is None:
+                return iter(())
+            return model._default_manager.values_list('pk', flat=True).iterator()
+        return iter(self._ids())
+
+    def __bool__(self):
+        if self.user.is_superuser:
+            model = self._model()
+            return model is not None and model._default_manager.exists()
+        return len(self._ids()) > 0
+
 class ObjPermLookupDict(object):
     def __init__(self, user, module_name):
         self.user, self.module_name = user, module_name
@@ -35,15 +81,16 @@ class ObjPermLookupDict(object):
         return str([p for p in self.user.get_all_permissions() if len(p.split('.')) == 3])
 
     def __getitem__(self, perm_name):
-        if self.user.is_superuser:
-            perms = Permission.objects.filter(content_type__app_label=self.module_name, codename=perm_name)
-            return [obj.pk for p in perms for obj in p.content_type.model_class().objects.all()]
-        return [p.object_id for p in self.user.objectpermissions.filter(perm__content_type__app_label=self.module_name, perm__codename=perm_name)]
+        return ObjPermSet(self.user, self.module_name, perm_name)
 
-    def __nonzero__(self):
+    def __bool__(self):
         if self.user.is_superuser:
             return True
-        return self.user.objectpermissions.filter(perm__contentype__app_label=self.module_name).exists()
+        if not (self.user.is_authenticated and self.user.is_active):
+            return False
+        prefix = "%s." % self.module_name
+        index = ObjectPermissionBackend().get_permission_index(self.user)
+        return any(ids for perm, ids in index.items() if perm.startswith(prefix))
 
 
 class ObjPermWrapper(object):
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.authorize.middleware import URLMatcher
+
+class LoopMatcher(object):
+    """The former matching, which tried every pattern in turn.
+    """
+    def __init__(self, required, exceptions=()):
+        self.required = tuple([re.compile(url) for url in required])
+        self.exceptions = tuple([re.compile(url) for url in exceptions])
+
+    def requires_login(self, path):
+        for url in self.exceptions:
+            if url.match(path): return False
+        for url in self.required:
+            if url.match(path): return True
+        return False
+
+class Command(BaseCommand):
+    help = "Measures the per-request cost of RequireLoginMiddleware URL matching."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patterns', type=int, default=300,
+                            help="Number of required URL patterns (plus one exception every ten).")
+        parser.add_argument('--paths', type=int, default=2000,
+                            help="Number of distinct request paths.")
+        parser.add_argument('--requests', type=int, default=50000,
+                            help="Number of requests to simulate.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        n = options['patterns']
+        required = [r'^/app%d/(.*)$' % i for i in range(n)]
+        exceptions = [r'^/app%d/public/(.*)$' % i for i in range(0, n, 10)]
+        paths = []
+        for i in range(options['paths']):
+            app = rnd.randrange(n * 2)
+            section = rnd.choice(('', 'public/', 'list/'))
+            paths.append('/app%d/%s%d/' % (app, section, i))
+        requests = [rnd.choice(paths) for i in range(options['requests'])]
+
+        modes = (
+            ("loop", LoopMatcher(required, exceptions).requires_login),
+            ("combined", URLMatcher(required, exceptions, cache_size=0).requires_login),
+            ("cached", URLMatcher(required, exceptions).requires_login),
+        )
+
+        expected = None
+        for name, requires_login in modes:
+            start = time.perf_counter()
+            results = [requires_login(path) for path in requests]
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = results
+            elif results != expected:
+                self.stderr.write("%s: results differ from the loop matcher!" % name)
+            self.stdout.write("%-9s %8.4fs  %8.2fus/request" % (name, elapsed, elapsed * 1e6 / len(requests)))
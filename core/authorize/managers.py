@@ -20,35 +20,170 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
+import uuid
+
 from django.db import models
 from django.apps import apps    
-from django.db.models import Q
-from django.contrib.auth.models import Permission, PermissionManager
-from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q, Exists, OuterRef
+from django.contrib.auth.models import PermissionManager
+from django.core.cache import cache
+from django.conf import settings
+
+from .registry import permissions
+
+# Default lifetime of cached permission indexes (in seconds). It bounds how
+# long a process can serve an index whose invalidation it missed.
+DEFAULT_PERMISSION_INDEX_TIMEOUT = 300
+
+PERMISSION_INDEX_VERSION_KEY = "authorize:perm_index_version"
+
+def visible_to(queryset, user, perm):
+    """Restricts queryset to the objects on which user has perm.
+
+    perm is a codename ("view_x") or a full permission name ("app.view_x").
+    As with the obj_permission_required decorator, users with the generic
+    model permission see every object. Other users only see the objects
+    they (or one of their groups) hold an object permission on. That check
+    is done in SQL with a semi-join, so counts and pages only touch the
+    authorized rows.
+    """
+    model = queryset.model
+    app_label, sep, codename = perm.rpartition('.')
+    app_label = app_label or model._meta.app_label
+
+    if not user.is_authenticated:
+        user_id = getattr(settings, 'ANONYMOUS_USER_ID', None)
+        if user_id is None:
+            return queryset.none()
+    elif not user.is_active:
+        return queryset.none()
+    elif user.is_superuser or user.has_perm("%s.%s" % (app_label, codename)):
+        return queryset
+    else:
+        user_id = user.pk
+
+    perm = permissions.get_for_model(model, codename)
+    if perm is None:
+        return queryset.none()
+
+    ObjectPermission = apps.get_model('authorize', 'ObjectPermission')
+    grants = ObjectPermission.objects.filter(perm=perm, object_id=OuterRef('pk'))
+    return queryset.filter(
+        Exists(grants.filter(users=user_id)) | Exists(grants.filter(groups__user=user_id))
+    )
+
+class VisibleToQuerySet(models.QuerySet):
+    """QuerySet which can be restricted to the objects visible to a user.
+    """
+    def visible_to(self, user, perm):
+        return visible_to(self, user, perm)
+
+VisibleToManager = models.Manager.from_queryset(VisibleToQuerySet)
 
 class MyPermissionManager(PermissionManager):
     """Custom manager for Permission model.
     """
     def get_or_create_by_natural_key(self, codename, app_label, model):
-        apps.get_models(get_app(app_label))
-        ct = ContentType.objects.get_for_model(apps.get_model(app_label, model))
-        action, sep, model_name = codename.rpartition('_')
-        name = "Can %s %s" % (action.replace('_', ' '), ct.name)
-        return Permission.objects.get_or_create(codename=codename, name=name, content_type=ct)
+        return permissions.get_or_create_for_model(apps.get_model(app_label, model), codename)
 
 class ObjectPermissionManager(models.Manager):
     """Custom manager for ObjectPermission model.
     """
     def get_by_natural_key(self, codename, app_label, model, object_id):
-        perm = Permission.objects.get_by_natural_key(codename, app_label, model)
+        perm = permissions.get_for_model(apps.get_model(app_label, model), codename)
+        if perm is None:
+            raise self.model.DoesNotExist("Permission %s.%s does not exist." % (app_label, codename))
         return self.get(perm=perm, object_id=object_id)
 
     def get_or_create_by_natural_key(self, codename, app_label, model, object_id):
-        perm, is_new = MyPermissionManager().get_or_create_by_natural_key(codename, app_label, model)
+        perm, is_new = permissions.get_or_create_for_model(apps.get_model(app_label, model), codename)
         return self.get_or_create(perm=perm, object_id=object_id)
 
     def get_group_permissions(self, user):
         return self.filter(groups__user=user)
 
+    def grant(self, codenames, objects, users=[], groups=[]):
+        """Grants the given permissions on objects to users and groups.
+
+        objects must be instances of the same model. users and groups can be
+        given as instances or primary keys. Missing object permissions and
+        assignments are written with a few bulk inserts, whatever the number
+        of objects, users and groups.
+        """
+        objects = [obj for obj in objects if obj is not None]
+        user_ids = set([getattr(u, 'pk', u) for u in users if u is not None])
+        group_ids = set([getattr(g, 'pk', g) for g in groups if g is not None])
+        if not objects or not codenames or not (user_ids or group_ids):
+            return
+
+        perms = dict([(codename, permissions.get_or_create_for_model(objects[0], codename)[0].pk) for codename in codenames])
+
+        object_ids = set([obj.pk for obj in objects])
+        wanted = set([(perm_id, obj_id) for perm_id in perms.values() for obj_id in object_ids])
+        lookup = self.filter(perm__in=perms.values(), object_id__in=object_ids)
+        existing = dict([((perm_id, obj_id), pk) for pk, perm_id, obj_id in lookup.values_list('pk', 'perm_id', 'object_id')])
+        missing = wanted - set(existing)
+        if missing:
+            self.bulk_create([self.model(perm_id=perm_id, object_id=obj_id) for perm_id, obj_id in missing], ignore_conflicts=True)
+            existing = dict([((perm_id, obj_id), pk) for pk, perm_id, obj_id in lookup.values_list('pk', 'perm_id', 'object_id')])
+
+        if user_ids:
+            through = self.model.users.through
+            through.objects.bulk_create([through(objectpermission_id=op_id, user_id=uid) for op_id in existing.values() for uid in user_ids], ignore_conflicts=True)
+            self.bump_index_version(user_ids)
+        if group_ids:
+            through = self.model.groups.through
+            through.objects.bulk_create([through(objectpermission_id=op_id, group_id=gid) for op_id in existing.values() for gid in group_ids], ignore_conflicts=True)
+            self.bump_index_version()
+
     def get_all_permissions(self, user):
         return self.filter(Q(groups__user=user) | Q(users=user))
+
+    def _user_version_key(self, user_id):
+        return "%s_%d" % (PERMISSION_INDEX_VERSION_KEY, user_id)
+
+    def get_index_version(self, user_id):
+        """Returns the version stamp of the permission index of the given user.
+
+        It combines a global version with a per-user one, both fetched
+        with a single cache lookup. Versions are unique tokens, so a version
+        key that is missing (or was evicted) gets a new one and an index
+        cached under an earlier stamp is never served again.
+        """
+        user_key = self._user_version_key(user_id)
+        versions = cache.get_many([PERMISSION_INDEX_VERSION_KEY, user_key])
+        for key in (PERMISSION_INDEX_VERSION_KEY, user_key):
+            if key not in versions:
+                cache.add(key, uuid.uuid4().hex, None)
+                versions[key] = cache.get(key)
+        return "%s.%s" % (versions[PERMISSION_INDEX_VERSION_KEY], versions[user_key])
+
+    def bump_index_version(self, user_ids=None):
+        """Invalidates the permission indexes of the given users (or of all users).
+        """
+        keys = [PERMISSION_INDEX_VERSION_KEY]
+        if user_ids is not None:
+            keys = [self._user_version_key(uid) for uid in user_ids]
+        if keys:
+            cache.set_many(dict([(key, uuid.uuid4().hex) for key in keys]), None)
+
+    def get_index(self, user):
+        """Returns the object permission index of the given user.
+
+        The index maps each permission name ("app_label.codename") to the set
+        of ids of the objects the user (or one of their groups) holds it on. It
+        is built with a single query and stored in the cache until the object
+        permissions of the user change, or for AUTHORIZE_PERMISSION_INDEX_TIMEOUT
+        seconds at most. Invalidations only reach the processes sharing the
+        cache, so deployments with many processes need a shared cache backend
+        (see CACHES in settings/base.py).
+        """
+        key = "authorize:perm_index_%d_%s" % (user.pk, self.get_index_version(user.pk))
+        index = cache.get(key)
+        if index is None:
+            index = {}
+            perms = self.get_all_permissions(user).values_list('perm__content_type__app_label', 'perm__codename', 'object_id').order_by()
+            for app_label, codename, object_id in perms:
+                index.setdefault("%s.%s" % (app_label, codename), set()).add(object_id)
+            cache.set(key, index, getattr(settings, 'AUTHORIZE_PERMISSION_INDEX_TIMEOUT', DEFAULT_PERMISSION_INDEX_TIMEOUT))
+        return index
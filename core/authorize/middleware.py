@@ -21,18 +21,64 @@ __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
      
 import re
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 
 from django.conf import settings  
 from django.contrib.auth.decorators import login_required
+from django.utils.deprecation import MiddlewareMixin
+
+from core.authorize.cache import LoggedInUserCache
+
+# Default number of paths whose match result is remembered.
+DEFAULT_LOGIN_REQUIRED_URLS_CACHE_SIZE = 1024
+
+# Numbered group references (\1, (?(1)...)), which combining patterns breaks.
+NUMBERED_GROUP_REFERENCE = re.compile(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\(\d)')
+
+class URLMatcher(object):
+    """Tells whether a path requires login, given required and exception patterns.
 
-from .core.auth.cache import LoggedInUserCache
+    All the patterns are compiled into one alternation, with the exceptions
+    first, so a path is matched with a single regex call. Results are
+    remembered per path in a bounded LRU cache. If the patterns can't be
+    combined (i.e. they use global inline flags, or refer to groups by
+    number, which the alternation would renumber), they're matched one by
+    one.
+    """
+    def __init__(self, required, exceptions=(), cache_size=DEFAULT_LOGIN_REQUIRED_URLS_CACHE_SIZE):
+        self.required = tuple([re.compile(url) for url in required])
+        self.exceptions = tuple([re.compile(url) for url in exceptions])
+        self.combined = None
+        branches = []
+        if self.exceptions:
+            branches.append('(?P<exception>%s)' % '|'.join(['(?:%s)' % p.pattern for p in self.exceptions]))
+        if self.required:
+            branches.append('(?P<required>%s)' % '|'.join(['(?:%s)' % p.pattern for p in self.required]))
+        if branches and not any(NUMBERED_GROUP_REFERENCE.search(p.pattern) for p in self.exceptions + self.required):
+            try:
+                self.combined = re.compile('|'.join(branches))
+            except re.error:
+                pass
+        self.requires_login = lru_cache(maxsize=cache_size)(self._requires_login)
+
+    def _requires_login(self, path):
+        if self.combined is not None:
+            m = self.combined.match(path)
+            return m is not None and m.lastgroup == 'required'
+        for url in self.exceptions:
+            if url.match(path): return False
+        for url in self.required:
+            if url.match(path): return True
+        return False
 
 # Inspired by http://www.djangosnippets.org/snippets/1220/
 
-class RequireLoginMiddleware(object):
+class RequireLoginMiddleware(MiddlewareMixin):
     """
     Middleware component that wraps the login_required decorator around 
-    matching URL patterns. To use, add the class to MIDDLEWARE_CLASSES and 
+    matching URL patterns. To use, add the class to MIDDLEWARE and 
     define LOGIN_REQUIRED_URLS and LOGIN_REQUIRED_URLS_EXCEPTIONS in your 
     settings.py. For example:
     ------
@@ -49,32 +95,58 @@ class RequireLoginMiddleware(object):
     
     LOGIN_REQUIRED_URLS_EXCEPTIONS is, conversely, where you explicitly 
     define any exceptions (like login and logout URLs).
+
+    LOGIN_REQUIRED_URLS_CACHE_SIZE is the number of paths whose result is
+    remembered (1024 by default).
     """
-    def __init__(self):
-        self.required = tuple([re.compile(url) for url in settings.LOGIN_REQUIRED_URLS])
-        self.exceptions = tuple([re.compile(url) for url in settings.LOGIN_REQUIRED_URLS_EXCEPTIONS])
+    def __init__(self, get_response):
+        super(RequireLoginMiddleware, self).__init__(get_response)
+        self.matcher = URLMatcher(
+            settings.LOGIN_REQUIRED_URLS,
+            settings.LOGIN_REQUIRED_URLS_EXCEPTIONS,
+            getattr(settings, 'LOGIN_REQUIRED_URLS_CACHE_SIZE', DEFAULT_LOGIN_REQUIRED_URLS_CACHE_SIZE)
+        )
     
     def process_view(self,request,view_func,view_args,view_kwargs):
         # No need to process URLs if user already logged in
-        if request.user.is_authenticated(): return None
-        # An exception match should immediately return None
-        for url in self.exceptions:
-            if url.match(request.path): return None
-        # Requests matching a restricted URL pattern are returned 
-        # wrapped with the login_required decorator
-        for url in self.required:
-            if url.match(request.path): return login_required(view_func)(request,*view_args,**view_kwargs)
+        if request.user.is_authenticated: return None
+        # Requests matching a restricted URL pattern (and no exception) are
+        # returned wrapped with the login_required decorator
+        if self.matcher.requires_login(request.path):
+            return login_required(view_func)(request,*view_args,**view_kwargs)
         # Explicitly return None for all non-matching requests
         return None
 
 # Inspired by http://stackoverflow.com/a/7469395/1063729
 
 class LoggedInUserCacheMiddleware(object):
-    """Initialize the user attribute of the LoggedInUserCache class.
+    """Stores the user of the current request in the LoggedInUserCache.
+
+    The user is only visible to the thread or task serving the request and
+    is cleared once the response is ready. Works with both WSGI and ASGI.
     """
-    def process_request(self, request):
-        logged_in_user = LoggedInUserCache()
-        logged_in_user.set_user(request)
+    sync_capable = True
+    async_capable = True
 
-        return None
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        logged_in_user = LoggedInUserCache()
+        token = logged_in_user.set_user(request)
+        try:
+            return self.get_response(request)
+        finally:
+            logged_in_user.reset(token)
 
+    async def __acall__(self, request):
+        logged_in_user = LoggedInUserCache()
+        token = logged_in_user.set_user(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            logged_in_user.reset(token)
@@ -86,6 +86,9 @@ class ObjectPermission(models.Model):
     class Meta:
         verbose_name = _('object permission')
         verbose_name_plural = _('object permissions')
+        constraints = [
+            models.UniqueConstraint(fields=['perm', 'object_id'], name='unique_object_permission'),
+        ]
 
     def __unicode__(self):
         return "%s | %d" % (self.perm, self.object_id)
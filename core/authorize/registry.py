@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import uuid
+import threading
+
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+PERMISSION_REGISTRY_VERSION_KEY = "authorize:permission_registry_version"
+
+class PermissionRegistry(object):
+    """Process-wide registry of all the permissions.
+
+    Permissions are loaded once (with their content types) and looked up by
+    (app_label, codename) or by (content_type_id, codename) without queries.
+    The registry is reloaded when its version in the shared cache changes,
+    which happens after migrations and whenever a permission is saved or
+    deleted, in any process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_name = {}
+        self._by_ct = {}
+
+    def _current_version(self):
+        """Returns the version of the registry in the shared cache.
+
+        A missing version is given a random value, so a version evicted
+        from the cache is never reused.
+        """
+        version = cache.get(PERMISSION_REGISTRY_VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(PERMISSION_REGISTRY_VERSION_KEY, version, None):
+                version = cache.get(PERMISSION_REGISTRY_VERSION_KEY) or version
+        return version
+
+    def _ensure_loaded(self):
+        version = self._current_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+
+    def _load(self, version):
+        by_name, by_ct = {}, {}
+        for perm in Permission.objects.select_related('content_type'):
+            by_name[(perm.content_type.app_label, perm.codename)] = perm
+            by_ct[(perm.content_type_id, perm.codename)] = perm
+        self._by_name, self._by_ct, self._version = by_name, by_ct, version
+
+    def _add(self, perm):
+        self._by_name[(perm.content_type.app_label, perm.codename)] = perm
+        self._by_ct[(perm.content_type_id, perm.codename)] = perm
+
+    def invalidate(self):
+        """Forces all the processes to reload their registries.
+        """
+        cache.set(PERMISSION_REGISTRY_VERSION_KEY, uuid.uuid4().hex, None)
+
+    def get(self, app_label, codename):
+        """Returns the permission "app_label.codename" or None.
+        """
+        self._ensure_loaded()
+        return self._by_name.get((app_label, codename), None)
+
+    def get_for_model(self, model, codename):
+        """Returns the permission codename of the given model or None.
+        """
+        self._ensure_loaded()
+        ct = ContentType.objects.get_for_model(model)
+        return self._by_ct.get((ct.pk, codename), None)
+
+    def get_or_create_for_model(self, model, codename):
+        """Returns the permission codename of the given model, creating it if missing.
+
+        Returns a (permission, created) tuple.
+        """
+        perm = self.get_for_model(model, codename)
+        if perm is not None:
+            return perm, False
+        ct = ContentType.objects.get_for_model(model)
+        action, sep, model_name = codename.rpartition('_')
+        name = "Can %s %s" % (action.replace('_', ' '), ct.name)
+        perm, is_new = Permission.objects.get_or_create(codename=codename, content_type=ct, defaults={'name': name})
+        self._add(perm)
+        return perm, is_new
+
+permissions = PermissionRegistry()
@@ -22,7 +22,7 @@ __version__ = '0.0.5'
 
 from django.db import models
 from django.db.models.signals import post_save
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group, Permission
 from django_comments.models import Comment
 from django.contrib.contenttypes.models import ContentType
 
@@ -31,8 +31,9 @@ from .core.menus.signals import manage_bookmarks
 from .core.widgets.models import Widget
 from .core.widgets.signals import manage_dashboard
 
-from cache import LoggedInUserCache
+from .cache import LoggedInUserCache
 from .models import *
+from .registry import permissions
 
 ## HANDLERS ##
 
@@ -41,17 +42,9 @@ def user_post_save(sender, instance, signal, *args, **kwargs):
     """
     profile, is_new = UserProfile.objects.get_or_create(user=instance)
     if is_new:
-        can_view_this_user, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_user", "auth", "user", instance.pk)
-        can_change_this_user, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_user", "auth", "user", instance.pk)
-        can_delete_this_user, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_user", "auth", "user", instance.pk)
-        can_change_user_bookmarks, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_menu", "menus", "menu", profile.bookmarks.pk)
-        can_change_user_dashboard, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_region", "widgets", "region", profile.dashboard.pk)
-
-        can_view_this_user.users.add(instance)
-        can_change_this_user.users.add(instance)
-        can_delete_this_user.users.add(instance)
-        can_change_user_bookmarks.users.add(instance)
-        can_change_user_dashboard.users.add(instance)
+        ObjectPermission.objects.grant(["view_user", "change_user", "delete_user"], [instance], users=[instance])
+        ObjectPermission.objects.grant(["change_menu"], [profile.bookmarks], users=[instance])
+        ObjectPermission.objects.grant(["change_region"], [profile.dashboard], users=[instance])
 
         can_view_bookmark, is_new = MyPermission.objects.get_or_create_by_natural_key("view_link", "menus", "link")
         can_add_bookmark, is_new = MyPermission.objects.get_or_create_by_natural_key("add_link", "menus", "link")
@@ -64,18 +57,63 @@ def update_author_permissions(sender, instance, *args, **kwargs):
     """Updates the permissions assigned to the author of the given object.
     """
     author = LoggedInUserCache().current_user
-    content_type = ContentType.objects.get_for_model(sender)
-    app_label = content_type.app_label
-    model_name = content_type.model
 
     if author:
-        can_view_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_%s" % model_name, app_label, model_name, instance.pk)
-        can_change_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_%s" % model_name, app_label, model_name, instance.pk)
-        can_delete_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_%s" % model_name, app_label, model_name, instance.pk)
+        model_name = ContentType.objects.get_for_model(sender).model
+        ObjectPermission.objects.grant(["view_%s" % model_name, "change_%s" % model_name, "delete_%s" % model_name], [instance], users=[author])
 
-        can_view_this_object.users.add(author)
-        can_change_this_object.users.add(author)
-        can_delete_this_object.users.add(author)
+def user_objectpermissions_changed(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    """Invalidates the permission indexes of the users gaining or losing object permissions.
+    """
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        ObjectPermission.objects.bump_index_version([instance.pk])
+    elif pk_set is not None:
+        ObjectPermission.objects.bump_index_version(pk_set)
+    else:
+        ObjectPermission.objects.bump_index_version()
+
+def group_objectpermissions_changed(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    """Invalidates the permission indexes when groups gain or lose object permissions.
+    """
+    if action.startswith('post_'):
+        ObjectPermission.objects.bump_index_version()
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    """Invalidates the permission indexes of the users joining or leaving groups.
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        ObjectPermission.objects.bump_index_version([instance.pk])
+    elif pk_set is not None:
+        ObjectPermission.objects.bump_index_version(pk_set)
+    else:
+        ObjectPermission.objects.bump_index_version()
+
+def group_pre_delete(sender, instance, *args, **kwargs):
+    """Remembers the members of a group being deleted.
+    """
+    instance._member_ids = list(instance.user_set.values_list('pk', flat=True))
+
+def group_post_delete(sender, instance, *args, **kwargs):
+    """Invalidates the permission indexes of the members of a deleted group.
+    """
+    member_ids = getattr(instance, '_member_ids', None)
+    if member_ids:
+        ObjectPermission.objects.bump_index_version(member_ids)
+
+def objectpermission_changed(sender, instance, *args, **kwargs):
+    """Invalidates all the permission indexes when an object permission is modified or deleted.
+    """
+    if not kwargs.get('created', False):
+        ObjectPermission.objects.bump_index_version()
+
+def invalidate_permission_registry(sender, *args, **kwargs):
+    """Makes all the processes reload their permission registries.
+    """
+    permissions.invalidate()
 
 ## CONNECTIONS ##
 
@@ -86,5 +124,16 @@ post_save.connect(update_author_permissions, Bookmark, dispatch_uid="update_book
 post_save.connect(update_author_permissions, Widget, dispatch_uid="update_widget_permissions")
 post_save.connect(update_author_permissions, Comment, dispatch_uid="update_comment_permissions")
 
+models.signals.m2m_changed.connect(user_objectpermissions_changed, ObjectPermission.users.through, dispatch_uid="user_objectpermissions_changed")
+models.signals.m2m_changed.connect(group_objectpermissions_changed, ObjectPermission.groups.through, dispatch_uid="group_objectpermissions_changed")
+models.signals.m2m_changed.connect(user_groups_changed, User.groups.through, dispatch_uid="user_groups_changed")
+models.signals.pre_delete.connect(group_pre_delete, Group, dispatch_uid="group_pre_delete")
+models.signals.post_delete.connect(group_post_delete, Group, dispatch_uid="group_post_delete")
+models.signals.post_migrate.connect(invalidate_permission_registry, dispatch_uid="invalidate_permission_registry")
+models.signals.post_save.connect(invalidate_permission_registry, Permission, dispatch_uid="permission_saved")
+models.signals.post_delete.connect(invalidate_permission_registry, Permission, dispatch_uid="permission_deleted")
+models.signals.post_save.connect(objectpermission_changed, ObjectPermission, dispatch_uid="objectpermission_saved")
+models.signals.post_delete.connect(objectpermission_changed, ObjectPermission, dispatch_uid="objectpermission_deleted")
+
 manage_bookmarks(UserProfile)
 manage_dashboard(UserProfile)
@@ -20,5 +20,7 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
-from .core.auth.tests.models import *
-from .core.auth.tests.backends import *
+from core.authorize.tests.models import *
+from core.authorize.tests.backends import *
+from core.authorize.tests.managers import *
+from core.authorize.tests.cache import *
@@ -20,9 +20,16 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
-from django.utils import unittest
+import unittest
 
-from .core.auth.backends import *
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+
+from core.authorize.backends import *
+from core.authorize.managers import PERMISSION_INDEX_VERSION_KEY
+from core.authorize.registry import PermissionRegistry, PERMISSION_REGISTRY_VERSION_KEY
 
 class ObjectPermissionBackendTestCase(unittest.TestCase):
     def test_has_perm(self):
@@ -41,3 +48,75 @@ class ObjectPermissionBackendTestCase(unittest.TestCase):
         self.assertFalse(b.has_perm(u, p_name, u))
         self.assertTrue(b.has_perm(u2, p_name, u))
         self.assertFalse(b.has_perm(u, p_name, u))
+
+class PermissionIndexInvalidationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.perm = Permission.objects.get_by_natural_key("change_group", "auth", "group")
+        self.perm_name = "auth.change_group"
+        self.user = User.objects.create(username="index_user")
+        self.group = Group.objects.create(name="index_group")
+        self.target = Group.objects.create(name="index_target")
+
+    def index(self):
+        return ObjectPermission.objects.get_index(User.objects.get(pk=self.user.pk))
+
+    def test_grant(self):
+        self.assertNotIn(self.target.pk, self.index().get(self.perm_name, ()))
+        ObjectPermission.objects.grant([self.perm.codename], [self.target], users=[self.user])
+        self.assertIn(self.target.pk, self.index()[self.perm_name])
+
+    def test_revoke(self):
+        ObjectPermission.objects.grant([self.perm.codename], [self.target], users=[self.user])
+        self.assertIn(self.target.pk, self.index()[self.perm_name])
+        ObjectPermission.objects.get(perm=self.perm, object_id=self.target.pk).users.remove(self.user)
+        self.assertNotIn(self.target.pk, self.index().get(self.perm_name, ()))
+
+    def test_group_membership(self):
+        ObjectPermission.objects.grant([self.perm.codename], [self.target], groups=[self.group])
+        self.assertNotIn(self.target.pk, self.index().get(self.perm_name, ()))
+        self.user.groups.add(self.group)
+        self.assertIn(self.target.pk, self.index()[self.perm_name])
+        self.user.groups.remove(self.group)
+        self.assertNotIn(self.target.pk, self.index().get(self.perm_name, ()))
+
+    def test_group_deletion(self):
+        ObjectPermission.objects.grant([self.perm.codename], [self.target], groups=[self.group])
+        self.user.groups.add(self.group)
+        self.assertIn(self.target.pk, self.index()[self.perm_name])
+        self.group.delete()
+        self.assertNotIn(self.target.pk, self.index().get(self.perm_name, ()))
+
+    def test_evicted_version_key(self):
+        ObjectPermission.objects.grant([self.perm.codename], [self.target], users=[self.user])
+        version = ObjectPermission.objects.get_index_version(self.user.pk)
+        self.assertIn(self.target.pk, self.index()[self.perm_name])
+
+        # A revoke whose invalidation is lost, then the version key is evicted.
+        ObjectPermission.users.through.objects.filter(user=self.user).delete()
+        cache.delete("%s_%d" % (PERMISSION_INDEX_VERSION_KEY, self.user.pk))
+
+        self.assertNotEqual(ObjectPermission.objects.get_index_version(self.user.pk), version)
+        self.assertNotIn(self.target.pk, self.index().get(self.perm_name, ()))
+
+    def test_evicted_global_version_key(self):
+        version = ObjectPermission.objects.get_index_version(self.user.pk)
+        cache.delete(PERMISSION_INDEX_VERSION_KEY)
+        self.assertNotEqual(ObjectPermission.objects.get_index_version(self.user.pk), version)
+
+class PermissionRegistryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.registry = PermissionRegistry()
+
+    def test_invalidate(self):
+        self.assertEqual(self.registry.get("auth", "audit_group"), None)
+        Permission.objects.create(codename="audit_group", name="Can audit group", content_type=ContentType.objects.get_for_model(Group))
+        self.assertNotEqual(self.registry.get("auth", "audit_group"), None)
+
+    def test_evicted_version_key(self):
+        self.assertEqual(self.registry.get("auth", "audit_group"), None)
+        Permission.objects.create(codename="audit_group", name="Can audit group", content_type=ContentType.objects.get_for_model(Group))
+        # A version evicted after the change must not match the one loaded.
+        cache.delete(PERMISSION_REGISTRY_VERSION_KEY)
+        self.assertNotEqual(self.registry.get("auth", "audit_group"), None)
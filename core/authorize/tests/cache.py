@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import asyncio
+import threading
+import unittest
+
+from core.authorize.cache import LoggedInUserCache
+from core.authorize.middleware import LoggedInUserCacheMiddleware
+
+class FakeUser(object):
+    is_authenticated = True
+
+    def __init__(self, name):
+        self.name = name
+
+class FakeRequest(object):
+    def __init__(self, user):
+        self.user = user
+
+class LoggedInUserCacheTestCase(unittest.TestCase):
+    def test_threads_are_isolated(self):
+        count = 20
+        barrier = threading.Barrier(count)
+        seen = {}
+
+        def view(request):
+            # Every thread has stored its user before anyone reads it.
+            barrier.wait()
+            return LoggedInUserCache().current_user
+
+        middleware = LoggedInUserCacheMiddleware(view)
+
+        def serve(i):
+            seen[i] = middleware(FakeRequest(FakeUser(i)))
+
+        threads = [threading.Thread(target=serve, args=(i,)) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(dict([(i, u.name) for i, u in seen.items()]), dict([(i, i) for i in range(count)]))
+        self.assertEqual(LoggedInUserCache().current_user, None)
+
+    def test_tasks_are_isolated(self):
+        count = 20
+
+        async def view(request):
+            before = LoggedInUserCache().current_user
+            await asyncio.sleep(0.01)
+            return before, LoggedInUserCache().current_user
+
+        middleware = LoggedInUserCacheMiddleware(view)
+
+        async def serve():
+            return await asyncio.gather(*[middleware(FakeRequest(FakeUser(i))) for i in range(count)])
+
+        results = asyncio.run(serve())
+
+        for i, (before, after) in enumerate(results):
+            self.assertEqual(before.name, i)
+            self.assertEqual(after.name, i)
+        self.assertEqual(LoggedInUserCache().current_user, None)
+
+    def test_user_is_cleared_after_response(self):
+        middleware = LoggedInUserCacheMiddleware(lambda request: LoggedInUserCache().current_user)
+        self.assertEqual(middleware(FakeRequest(FakeUser("u"))).name, "u")
+        self.assertEqual(LoggedInUserCache().current_user, None)
+        self.assertFalse(LoggedInUserCache().has_user)
+
+    def test_anonymous_user(self):
+        anonymous = FakeUser("anonymous")
+        anonymous.is_authenticated = False
+        middleware = LoggedInUserCacheMiddleware(lambda request: LoggedInUserCache().current_user)
+        self.assertEqual(middleware(FakeRequest(anonymous)), None)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.contrib.auth.models import User, Group, Permission
+
+from core.authorize.models import ObjectPermission
+from core.authorize.managers import visible_to
+
+@override_settings(AUTHENTICATION_BACKENDS=[
+    'django.contrib.auth.backends.ModelBackend',
+    'core.authorize.backends.ObjectPermissionBackend',
+])
+class VisibleToTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.perm = Permission.objects.get_by_natural_key("change_group", "auth", "group")
+        self.targets = [Group.objects.create(name="visible%d" % i) for i in range(4)]
+        self.queryset = Group.objects.filter(name__startswith="visible")
+        self.team = Group.objects.create(name="team")
+
+    def user(self, username, **kwargs):
+        return User.objects.create(username=username, **kwargs)
+
+    def assertVisible(self, user, expected):
+        # Users are reloaded, as they cache their permissions.
+        user = User.objects.get(pk=user.pk)
+        visible = set(visible_to(self.queryset, user, "change_group"))
+        self.assertEqual(visible, set(expected))
+        # Like obj_permission_required, model permissions cover every object.
+        allowed = set([o for o in self.targets if user.has_perm("auth.change_group", o) or user.has_perm("auth.change_group")])
+        self.assertEqual(visible, allowed)
+        self.assertEqual(set(visible_to(self.queryset, user, "auth.change_group")), visible)
+
+    def test_superuser(self):
+        self.assertVisible(self.user("super", is_superuser=True), self.targets)
+
+    def test_model_permission(self):
+        user = self.user("model")
+        user.user_permissions.add(self.perm)
+        self.assertVisible(user, self.targets)
+
+    def test_object_grant(self):
+        user = self.user("direct")
+        ObjectPermission.objects.grant(["change_group"], self.targets[:2], users=[user])
+        self.assertVisible(user, self.targets[:2])
+
+    def test_group_grant(self):
+        user = self.user("member")
+        user.groups.add(self.team)
+        ObjectPermission.objects.grant(["change_group"], self.targets[1:3], groups=[self.team])
+        ObjectPermission.objects.grant(["change_group"], self.targets[2:], users=[user])
+        self.assertVisible(user, self.targets[1:])
+
+    def test_no_grant(self):
+        user = self.user("nobody")
+        ObjectPermission.objects.grant(["change_group"], self.targets, users=[self.user("somebody")])
+        ObjectPermission.objects.grant(["delete_group"], self.targets, users=[user])
+        self.assertVisible(user, [])
+
+    def test_inactive(self):
+        user = self.user("inactive", is_active=False)
+        ObjectPermission.objects.grant(["change_group"], self.targets, users=[user])
+        self.assertEqual(list(visible_to(self.queryset, user, "change_group")), [])
+
+@override_settings(AUTHENTICATION_BACKENDS=[
+    'django.contrib.auth.backends.ModelBackend',
+    'core.authorize.backends.ObjectPermissionBackend',
+])
+class GrantTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.targets = [Group.objects.create(name="granted%d" % i) for i in range(3)]
+        self.team = Group.objects.create(name="team")
+        self.user = User.objects.create(username="user")
+        self.member = User.objects.create(username="member")
+        self.member.groups.add(self.team)
+
+    def grant(self):
+        ObjectPermission.objects.grant(["view_group", "change_group"], self.targets, users=[self.user], groups=[self.team])
+
+    def assertGranted(self):
+        perms = ObjectPermission.objects.filter(perm__codename__in=["view_group", "change_group"], object_id__in=[g.pk for g in self.targets])
+        self.assertEqual(perms.count(), 6)
+        self.assertEqual(ObjectPermission.users.through.objects.filter(objectpermission__in=perms).count(), 6)
+        self.assertEqual(ObjectPermission.groups.through.objects.filter(objectpermission__in=perms).count(), 6)
+
+    def test_idempotent(self):
+        self.grant()
+        self.assertGranted()
+        # One lookup, then one insert for users and one for groups.
+        with self.assertNumQueries(3):
+            self.grant()
+        self.assertGranted()
+
+    def test_existing_permissions(self):
+        # Rows matching the (perm, object_id) constraint are reused, not duplicated.
+        ObjectPermission.objects.get_or_create_by_natural_key("view_group", "auth", "group", self.targets[0].pk)
+        ObjectPermission.objects.grant(["change_group"], self.targets[1:], users=[self.user])
+        self.grant()
+        self.assertGranted()
+
+    def test_primary_keys(self):
+        ObjectPermission.objects.grant(["view_group", "change_group"], self.targets, users=[self.user.pk], groups=[self.team.pk])
+        self.assertGranted()
+
+    def test_nothing_to_grant(self):
+        with self.assertNumQueries(0):
+            ObjectPermission.objects.grant(["view_group"], self.targets)
+            ObjectPermission.objects.grant([], self.targets, users=[self.user])
+            ObjectPermission.objects.grant(["view_group"], [], users=[self.user])
+
+    def test_index_invalidation(self):
+        # Both indexes are cached before the grant.
+        for user in (self.user, self.member):
+            self.assertFalse(User.objects.get(pk=user.pk).has_perm("auth.change_group", self.targets[0]))
+        self.grant()
+        for user in (self.user, self.member):
+            user = User.objects.get(pk=user.pk)
+            for target in self.targets:
+                self.assertTrue(user.has_perm("auth.view_group", target))
+                self.assertTrue(user.has_perm("auth.change_group", target))
+            self.assertFalse(user.has_perm("auth.delete_group", self.targets[0]))
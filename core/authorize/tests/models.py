@@ -20,10 +20,10 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
-from django.utils import unittest
+import unittest
 from django.contrib.auth.models import User
 
-from .core.auth.models import *
+from core.authorize.models import *
 
 class MyUserTestCase(unittest.TestCase):
     def test_proxy(self):
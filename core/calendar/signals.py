@@ -19,12 +19,7 @@ def manage_calendar(cls):
 def update_attendees_event_permissions(sender, instance, action, **kwargs):
     """Updates the permissions assigned to the attendees of the given event."""
     if action in ["post_add", "post_remove", "post_clear"]:
-        can_view_this_event, _ = ObjectPermission.objects.get_or_create_by_natural_key("view_event", "calendar", "event", instance.pk)
-        can_change_this_event, _ = ObjectPermission.objects.get_or_create_by_natural_key("change_event", "calendar", "event", instance.pk)
-
-        for att in instance.attendees.all():
-            can_view_this_event.users.add(att)
-            can_change_this_event.users.add(att)
+        ObjectPermission.objects.grant(["view_event", "change_event"], [instance], users=instance.attendees.all())
 
 @receiver(post_save, sender=Event)
 def create_calendar(sender, instance, created, **kwargs):
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import itertools
+import time
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context
+from django.test import RequestFactory
+from django.utils.safestring import mark_safe
+from django.utils.translation import gettext as _
+
+from core.utils import field_to_value, value_to_string, table_fields
+from core.authorize.backends import get_object_perms_for
+from core.templatetags.details import DetailTableNode, DetailTableRendering, row_template
+
+class LegacyDetailTableNode(DetailTableNode):
+    """The former rendering, which resolved every cell and URL per row.
+    """
+    def render_with_args(self, context, object_list, fields=[], exclude=[], *args, **kwargs):
+        instance = object_list[0]
+        meta = instance._meta
+        table = DetailTableRendering(context['request'], object_list, table_fields(instance.__class__, fields, exclude))
+        table.object_perms = get_object_perms_for(table.request.user, object_list, ["change_%s" % meta.model_name, "delete_%s" % meta.model_name])
+        output = u'<table class="%s-detail-table">\n' % instance.__class__.__name__.lower()
+        output += u'\t<tr>\n'
+        for f in table.field_list:
+            verbose_name = _(f.verbose_name)
+            verbose_name = verbose_name[0].capitalize() + verbose_name[1:]
+            field_type = f.__class__.__name__.lower().replace("field", "")
+            if f.choices:
+                field_type += "_choices"
+            output += u'\t\t<th class="%s"><a href="./?order_by=%s">%s</a></th>\n' % (field_type, f.name, verbose_name)
+        if any(self.actions_template(table, o) for o in object_list):
+            output += u'\t\t<th class="actions"></th>'
+        output += u'\t</tr>\n'
+        for i, instance in enumerate(object_list):
+            output += row_template(i)
+            for j, f in enumerate(table.field_list):
+                output += self.column_template(table, instance, j)
+            output += self.actions_template(table, instance)
+            output += u'\t</tr>\n'
+        output += u'</table>\n'
+        return mark_safe(output)
+
+    def column_template(self, table, instance, index):
+        css = ''
+        value = field_to_value(table.field_list[index], instance)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            css = u' class="number"'
+        value = value_to_string(value)
+        if index == 0 and hasattr(instance, 'get_absolute_url'):
+            value = u'<a href="%s">%s</a>' % (instance.get_absolute_url(), value)
+        return u'\t\t<td%s>%s</td>\n' % (css, value)
+
+    def actions_template(self, table, instance):
+        table.edit_url = lambda o: o.get_edit_url()
+        table.delete_url = lambda o: o.get_delete_url()
+        return super(LegacyDetailTableNode, self).actions_template(table, instance)
+
+class Command(BaseCommand):
+    help = "Measures the rendering time of detail_table on existing objects of a model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', nargs='?', default='auth.User',
+                            help="Model to render, as app_label.ModelName.")
+        parser.add_argument('--rows', type=int, default=1000,
+                            help="Number of table rows (stored objects are repeated if fewer).")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of renderings to time.")
+        parser.add_argument('--fields', default='',
+                            help="Comma-separated fields to show (all by default).")
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        fields = [f for f in options['fields'].split(',') if f]
+        stored = list(model._default_manager.all()[:options['rows']])
+        if not stored:
+            raise CommandError("There are no %s objects to render." % model._meta.verbose_name_plural)
+        object_list = list(itertools.islice(itertools.cycle(stored), options['rows']))
+
+        request = RequestFactory().get('/')
+        request.user = get_user_model()(is_superuser=True, is_active=True)
+        context = Context({'request': request})
+
+        expected = None
+        for name, node in (("former", LegacyDetailTableNode()), ("compiled", DetailTableNode())):
+            output = node.render_with_args(context, object_list, fields)
+            start = time.perf_counter()
+            for i in range(options['repeat']):
+                output = node.render_with_args(context, object_list, fields)
+            elapsed = (time.perf_counter() - start) / options['repeat']
+            if expected is None:
+                expected = output
+            elif output != expected:
+                self.stderr.write("%s: output differs from the former rendering!" % name)
+            self.stdout.write("%-9s %8.4fs/table  %8.2fus/row" % (name, elapsed, elapsed * 1e6 / len(object_list)))
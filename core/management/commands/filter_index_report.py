@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import ast
+import os
+
+from django.core.management.base import BaseCommand
+from django.apps import apps
+from django.db import connection, models
+
+from core.utils import is_visible
+from core.utils.filters import filter_kind, index_hint, has_index
+
+LIST_VIEW_FUNCTIONS = ('filtered_list_detail', 'filter_objects')
+
+def _literal(node, default):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return default
+
+def _root_name(node):
+    """Returns the name at the root of an expression like X.objects.f(...).
+    """
+    while True:
+        if isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Attribute):
+            node = node.value
+        elif isinstance(node, ast.Name):
+            return node.id
+        else:
+            return None
+
+class Command(BaseCommand):
+    help = "Reports the indexes needed by the filters of the list views."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Also lists the fields which are already indexed.")
+
+    def handle(self, *args, **options):
+        models_by_name = {}
+        for model in apps.get_models():
+            models_by_name.setdefault(model.__name__, model)
+
+        missing = 0
+        for path, lineno, model_name, fields, exclude in self.find_list_views():
+            location = "%s:%d" % (os.path.relpath(path), lineno)
+            model = models_by_name.get(model_name, None)
+            if model is None:
+                self.stdout.write("%s: model not resolved, skipped." % location)
+                continue
+            for field in model._meta.fields:
+                hint = index_hint(field)
+                if not is_visible(field.name, fields, exclude) or hint is None:
+                    continue
+                indexed = has_index(field) and hint != 'trigram'
+                if indexed and not options['all']:
+                    continue
+                missing += not indexed
+                self.stdout.write("%s: %s.%s (%s) %s" % (
+                    location,
+                    model._meta.label,
+                    field.name,
+                    filter_kind(field),
+                    "indexed" if indexed else "needs %s" % self.suggest(model, field, hint),
+                ))
+
+        self.stdout.write("%d missing index(es)." % missing)
+
+    def suggest(self, model, field, hint):
+        """Returns the index to add for the given field.
+        """
+        name = "%s_%s_idx" % (model._meta.db_table, field.column)
+        if hint == 'trigram':
+            return "GinIndex(fields=['%s'], name='%s', opclasses=['gin_trgm_ops'])" % (field.name, name[:30])
+        if hint == 'btree_pattern' and connection.vendor == 'postgresql':
+            opclass = 'text_pattern_ops' if isinstance(field, models.TextField) else 'varchar_pattern_ops'
+            return "Index(fields=['%s'], name='%s', opclasses=['%s'])" % (field.name, name[:30], opclass)
+        return "Index(fields=['%s'], name='%s')" % (field.name, name[:30])
+
+    def find_list_views(self):
+        """Yields the filtered list views found in the views of the installed apps.
+
+        Yields (path, line, model name, fields, exclude) tuples. The model
+        is the name at the root of the listed expression (i.e. "Project" for
+        Project or Project.objects.all()).
+        """
+        for app_config in apps.get_app_configs():
+            for path in self.view_modules(app_config.path):
+                with open(path) as f:
+                    try:
+                        tree = ast.parse(f.read(), path)
+                    except SyntaxError:
+                        continue
+                for node in ast.walk(tree):
+                    if not isinstance(node, ast.Call):
+                        continue
+                    func = node.func
+                    name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+                    if name not in LIST_VIEW_FUNCTIONS:
+                        continue
+                    kwargs = dict([(k.arg, k.value) for k in node.keywords if k.arg])
+                    target = node.args[1] if len(node.args) > 1 else kwargs.get('model_or_queryset', None)
+                    yield (
+                        path,
+                        node.lineno,
+                        _root_name(target) if target is not None else None,
+                        _literal(kwargs['fields'], []) if 'fields' in kwargs else [],
+                        _literal(kwargs['exclude'], []) if 'exclude' in kwargs else [],
+                    )
+
+    def view_modules(self, app_path):
+        candidates = [os.path.join(app_path, 'views.py')]
+        views_dir = os.path.join(app_path, 'views')
+        if os.path.isdir(views_dir):
+            candidates += [os.path.join(views_dir, f) for f in sorted(os.listdir(views_dir)) if f.endswith('.py')]
+        return [path for path in candidates if os.path.isfile(path)]
@@ -31,5 +31,10 @@ class SignatureAdmin(admin.ModelAdmin):
 class StreamAdmin(admin.ModelAdmin):
     pass
 
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'user', 'created', 'attempts', 'sent')
+    list_filter = ('sent',)
+
 admin.site.register(Signature, SignatureAdmin)
 admin.site.register(Stream, StreamAdmin)
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import time
+import logging
+from collections import namedtuple
+
+from django.db.models import Exists, OuterRef
+from django.conf import settings
+
+from .models import Subscription, Notification, NotificationCounter
+
+logger = logging.getLogger(__name__)
+
+# Number of notifications written by each INSERT.
+DEFAULT_NOTIFICATIONS_FANOUT_BATCH_SIZE = 500
+
+FanOutReport = namedtuple('FanOutReport', [
+    'activity',
+    'notifications',
+    'emails',
+    'resolve_time',
+    'write_time',
+])
+
+def resolve_subscriptions(activity):
+    """Returns the subscriptions which should be notified about the given activity.
+
+    Subscribers of the activity's signature are intersected with the followers
+    of the streams the activity is attached to, skipping users which have
+    already been notified. Everything is resolved by a single query.
+    """
+    already_notified = Notification.objects.filter(
+        user=OuterRef('user'),
+        signature=OuterRef('signature'),
+        dispatch_uid="%d" % activity.pk
+    )
+    return Subscription.objects.filter(
+        signature__slug=activity.signature,
+        user__followed_streams__activities=activity
+    ).exclude(
+        Exists(already_notified)
+    ).select_related('user', 'signature').distinct()
+
+def fan_out(activity, content=None):
+    """Notifies the given activity to all its recipients.
+
+    Recipients are resolved by resolve_subscriptions, deduplicated by user and
+    their notifications are written with bulk inserts of
+    NOTIFICATIONS_FANOUT_BATCH_SIZE rows. Returns a
+    FanOutReport with the created notifications, the ones which should be sent
+    by e-mail and the time spent resolving and writing them.
+    """
+    start = time.perf_counter()
+
+    subscriptions = {}
+    for subscription in resolve_subscriptions(activity):
+        subscriptions.setdefault(subscription.user_id, subscription)
+
+    resolved = time.perf_counter()
+
+    notifications = []
+    emails = []
+
+    if subscriptions:
+        if content is None:
+            content = activity.get_content()
+        title = u"%s" % activity
+        dispatch_uid = "%d" % activity.pk
+
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                signature=s.signature,
+                user=s.user,
+                title=title,
+                description=content,
+                dispatch_uid=dispatch_uid
+            )
+            for s in subscriptions.values()
+        ], batch_size=getattr(settings, 'NOTIFICATIONS_FANOUT_BATCH_SIZE', DEFAULT_NOTIFICATIONS_FANOUT_BATCH_SIZE))
+        emails = [n for n, s in zip(notifications, subscriptions.values()) if s.send_email]
+        NotificationCounter.objects.add([n.user_id for n in notifications])
+
+    written = time.perf_counter()
+
+    report = FanOutReport(activity, notifications, emails, resolved - start, written - resolved)
+
+    logger.debug(
+        "Activity %d notified to %d users (%d by e-mail): resolved in %.4fs, written in %.4fs.",
+        activity.pk, len(notifications), len(emails), report.resolve_time, report.write_time
+    )
+
+    return report
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.apps import apps
+
+from core.notifications.models import Observable
+
+class SetattrObservable(object):
+    """The former change tracking, which intercepted every assignment.
+    """
+    def __setattr__(self, name, value):
+        field = self._meta._forward_fields_map.get(name, None)
+        if field is not None and self.__dict__.get(self._meta.pk.attname, None) is not None:
+            old_value = field.value_from_object(self) if field.attname in self.__dict__ else None
+            super().__setattr__(name, value)
+            new_value = field.value_from_object(self)
+            if new_value != old_value:
+                self.__dict__.setdefault('_changes', {})[str(field.verbose_name)] = (str(old_value), str(new_value))
+            return
+        super().__setattr__(name, value)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        return models.Model.from_db.__func__(cls, db, field_names, values)
+
+class Untracked(object):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        return models.Model.from_db.__func__(cls, db, field_names, values)
+
+class Command(BaseCommand):
+    help = "Measures the cost of loading objects of an observable model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', metavar='app_label.ModelName')
+        parser.add_argument('--rows', type=int, default=10000,
+                            help="Number of objects to load.")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Number of runs for each mode (the best one is shown).")
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        field_names = [f.attname for f in model._meta.concrete_fields]
+        rows = list(model._default_manager.values_list(*field_names)[:options['rows']])
+        if not rows:
+            raise CommandError("There are no %s objects to load." % model._meta.verbose_name)
+        rows = (rows * (options['rows'] // len(rows) + 1))[:options['rows']]
+
+        modes = (
+            ("untracked", self.proxy(model, Untracked)),
+            ("setattr", self.proxy(model, SetattrObservable)),
+            ("snapshot", model if issubclass(model, Observable) else self.proxy(model, Observable)),
+        )
+
+        for name, cls in modes:
+            timings = []
+            for i in range(options['repeat']):
+                start = time.perf_counter()
+                for row in rows:
+                    cls.from_db('default', field_names, row)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            self.stdout.write("%-10s %8.4fs  %6.2fus/object" % (name, best, best * 1e6 / len(rows)))
+
+    def proxy(self, model, mixin):
+        """Returns a proxy of model which uses the given tracking mix-in.
+        """
+        name = "%s%sBenchmark" % (model.__name__, mixin.__name__)
+        try:
+            return apps.get_model(model._meta.app_label, name)
+        except LookupError:
+            meta = type('Meta', (), {'proxy': True, 'app_label': model._meta.app_label})
+            return type(name, (mixin, model), {'__module__': __name__, 'Meta': meta})
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import os
+import gzip
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.db import transaction
+from django.conf import settings
+
+from core.notifications.models import Activity, ArchivedActivity, Notification, ArchivedNotification, OutboxEmail
+
+DEFAULT_RETENTION_DAYS = 180
+
+class Command(BaseCommand):
+    help = "Deletes orphan activities and archives old activities and read notifications."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'NOTIFICATIONS_RETENTION_DAYS', DEFAULT_RETENTION_DAYS),
+                            help="Age (in days) after which activities and read notifications are archived.")
+        parser.add_argument('--archive', choices=('table', 'json'), default='table',
+                            help="Moves old rows to the archive tables or to gzipped JSON files.")
+        parser.add_argument('--archive-dir', default=getattr(settings, 'NOTIFICATIONS_ARCHIVE_DIR', None),
+                            help="Directory of the JSON archive files.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of rows processed by each transaction.")
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to wait between two batches.")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        self.archive_dir = options['archive_dir']
+
+        if options['archive'] == 'json':
+            if not self.archive_dir:
+                raise CommandError("An archive directory is required to archive to JSON files.")
+            os.makedirs(self.archive_dir, exist_ok=True)
+            archive = self.archive_to_file
+        else:
+            archive = self.archive_to_table
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        count = self.compact(Activity.objects.orphans())
+        self.stdout.write("%d orphan activities deleted." % count)
+
+        count = self.compact(Activity.objects.filter(created__lt=cutoff), lambda batch: archive(ArchivedActivity, self.serialize_activities(batch)))
+        self.stdout.write("%d activities archived." % count)
+
+        count = self.compact(Notification.objects.filter(read__isnull=False, created__lt=cutoff), lambda batch: archive(ArchivedNotification, self.serialize_notifications(batch)))
+        self.stdout.write("%d read notifications archived." % count)
+
+        count = self.compact(OutboxEmail.objects.filter(sent__lt=cutoff))
+        self.stdout.write("%d sent e-mails deleted." % count)
+
+    def compact(self, queryset, archive=None):
+        """Deletes all the rows of queryset, passing them to "archive" first.
+
+        Rows are processed in batches, each one in its own transaction, so
+        locks are held only for a short time.
+        """
+        count = 0
+        while True:
+            with transaction.atomic():
+                pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+                if not pks:
+                    break
+                batch = queryset.model._default_manager.filter(pk__in=pks)
+                if archive:
+                    archive(batch)
+                batch.delete()
+            count += len(pks)
+            if self.pause:
+                time.sleep(self.pause)
+        return count
+
+    def serialize_activities(self, batch):
+        stream_ids = {}
+        for activity_id, stream_id in Activity.streams.through.objects.filter(activity__in=batch).values_list('activity_id', 'stream_id'):
+            stream_ids.setdefault(activity_id, []).append(stream_id)
+        return [{
+            "activity_id": a.pk,
+            "title": a.title,
+            "signature": a.signature,
+            "context": a.context,
+            "content": a.content,
+            "created": a.created,
+            "backlink": a.backlink,
+            "stream_ids": stream_ids.get(a.pk, []),
+        } for a in batch]
+
+    def serialize_notifications(self, batch):
+        return [{
+            "notification_id": n.pk,
+            "title": n.title,
+            "description": n.description,
+            "user_id": n.user_id,
+            "signature_id": n.signature_id,
+            "created": n.created,
+            "read": n.read,
+            "dispatch_uid": n.dispatch_uid,
+        } for n in batch]
+
+    def archive_to_table(self, model, rows):
+        model.objects.bulk_create([model(**row) for row in rows])
+
+    def archive_to_file(self, model, rows):
+        filename = "%s-%s.json.gz" % (model._meta.model_name, timezone.now().strftime("%Y%m%d%H%M%S%f"))
+        with gzip.open(os.path.join(self.archive_dir, filename), 'wt', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, cls=DjangoJSONEncoder))
+                f.write("\n")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from django.db import transaction, connections
+from django.conf import settings
+
+from core.notifications.models import OutboxEmail
+
+DEFAULT_EMAIL_BATCH_SIZE = 100
+DEFAULT_EMAIL_MAX_ATTEMPTS = 5
+DEFAULT_EMAIL_RETRY_DELAY = 60 # seconds, doubled at every failed attempt.
+DEFAULT_EMAIL_MAX_RETRY_DELAY = 6 * 60 * 60
+
+class Command(BaseCommand):
+    help = "Sends the e-mails queued in the notification outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'NOTIFICATIONS_EMAIL_BATCH_SIZE', DEFAULT_EMAIL_BATCH_SIZE),
+                            help="Number of queued e-mails fetched at once.")
+        parser.add_argument('--max-attempts', type=int, default=getattr(settings, 'NOTIFICATIONS_EMAIL_MAX_ATTEMPTS', DEFAULT_EMAIL_MAX_ATTEMPTS),
+                            help="Number of delivery attempts before an e-mail is given up.")
+        parser.add_argument('--digest', action='store_true',
+                            help="Sends a single digest e-mail per user for each batch.")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keeps polling the outbox instead of exiting once it is empty.")
+        parser.add_argument('--interval', type=float, default=10,
+                            help="Seconds to wait between two polls when --loop is given.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.flush(options['batch_size'], options['max_attempts'], options['digest'])
+            if sent or failed:
+                self.stdout.write("%d e-mail(s) sent, %d failed." % (sent, failed))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def flush(self, batch_size, max_attempts, digest=False):
+        """Sends all the pending e-mails over a single SMTP connection.
+
+        Returns the number of sent and failed e-mails.
+        """
+        sent = failed = 0
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            self.stderr.write("Cannot connect to the mail server: %s" % e)
+            return sent, failed
+        try:
+            while True:
+                with transaction.atomic():
+                    batch = self.next_batch(batch_size, max_attempts, digest)
+                    if not batch:
+                        break
+                    s, f = self.send_batch(connection, batch, digest)
+                    sent += s
+                    failed += f
+        finally:
+            connection.close()
+        return sent, failed
+
+    def next_batch(self, batch_size, max_attempts, digest=False):
+        """Locks and returns the next batch of pending e-mails.
+
+        In digest mode a batch holds all the pending e-mails of up to
+        "batch_size" users. Only the outbox rows are locked where the backend
+        supports "SELECT ... FOR UPDATE OF" (it is not the case of MySQL).
+        """
+        pending = OutboxEmail.objects.pending(max_attempts)
+        if digest:
+            user_ids = pending.order_by('user_id').values_list('user_id', flat=True).distinct()[:batch_size]
+            pending = pending.filter(user_id__in=list(user_ids))
+        else:
+            pending = pending[:batch_size]
+        if connections[pending.db].features.has_select_for_update_of:
+            pending = pending.select_for_update(skip_locked=True, of=('self',))
+        else:
+            pending = pending.select_for_update(skip_locked=True)
+        return list(pending.select_related('user'))
+
+    def send_batch(self, connection, batch, digest=False):
+        if digest:
+            groups = {}
+            for email in batch:
+                groups.setdefault(email.user_id, []).append(email)
+            groups = list(groups.values())
+        else:
+            groups = [[email] for email in batch]
+
+        now = timezone.now()
+        delivered = []
+        retried = []
+
+        for group in groups:
+            try:
+                connection.send_messages([self.build_message(group)])
+                delivered.extend(group)
+            except Exception as e:
+                # Drops a possibly broken connection before going on.
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+                for email in group:
+                    email.attempts += 1
+                    email.last_error = "%s" % e
+                    email.next_attempt = now + self.backoff(email.attempts)
+                retried.extend(group)
+
+        if delivered:
+            OutboxEmail.objects.filter(pk__in=[e.pk for e in delivered]).update(sent=now)
+        if retried:
+            OutboxEmail.objects.bulk_update(retried, ['attempts', 'last_error', 'next_attempt'])
+
+        return len(delivered), len(retried)
+
+    def build_message(self, emails):
+        email_from = getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@localhost.com')
+        recipient = emails[0].user.email
+        if len(emails) == 1:
+            subject, body = emails[0].subject, emails[0].body
+        else:
+            subject = _("%d new notifications") % len(emails)
+            body = render_to_string("notifications/emails/digest.html", {"emails": emails})
+        message = EmailMessage(subject, body, email_from, [recipient,])
+        message.content_subtype = "html"
+        return message
+
+    def backoff(self, attempts):
+        retry_delay = getattr(settings, 'NOTIFICATIONS_EMAIL_RETRY_DELAY', DEFAULT_EMAIL_RETRY_DELAY)
+        max_retry_delay = getattr(settings, 'NOTIFICATIONS_EMAIL_MAX_RETRY_DELAY', DEFAULT_EMAIL_MAX_RETRY_DELAY)
+        return timedelta(seconds=min(retry_delay * 2 ** (attempts - 1), max_retry_delay))
@@ -20,7 +20,101 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
+import uuid
+from collections import Counter
+
 from django.db import models
+from django.db.models import Exists, OuterRef, F, Count
+from django.db.models.functions import Greatest
+from django.apps import apps
+from django.core.cache import cache
+from django.conf import settings
+from django.utils import timezone
+
+# Default lifetime of cached stream links (in seconds).
+DEFAULT_STREAM_LINKS_TIMEOUT = 300
+
+STREAM_LINKS_VERSION_KEY = "notifications:stream_links_version"
+
+# Default lifetime of cached unread counts (in seconds).
+DEFAULT_UNREAD_COUNT_TIMEOUT = 300
+
+UNREAD_COUNT_VERSION_KEY = "notifications:unread_count_version"
+
+class StreamManager(models.Manager):
+    """Manager for streams.
+    """
+    def get_links_version(self):
+        """Returns the version of the cached stream links.
+
+        A missing version is given a random value, so a version evicted from
+        the cache is never reused.
+        """
+        version = cache.get(STREAM_LINKS_VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(STREAM_LINKS_VERSION_KEY, version, None):
+                version = cache.get(STREAM_LINKS_VERSION_KEY) or version
+        return version
+
+    def bump_links_version(self):
+        """Invalidates all the cached stream links.
+        """
+        cache.set(STREAM_LINKS_VERSION_KEY, uuid.uuid4().hex, None)
+
+    def downstream_of(self, stream_ids):
+        """Returns the ids of all the streams transitively linked by the given ones.
+
+        The given streams are not part of the result, unless they are reachable
+        through a cycle. Each stream's downstream set is cached until links
+        change.
+        """
+        version = self.get_links_version()
+        keys = dict([("notifications:stream_%d_downstream_%s" % (pk, version), pk) for pk in stream_ids])
+        cached = cache.get_many(keys.keys())
+        missing = {}
+        downstream = set()
+
+        for key, pk in keys.items():
+            if key in cached:
+                downstream.update(cached[key])
+            else:
+                missing[key] = self._walk_links(pk)
+                downstream.update(missing[key])
+
+        if missing:
+            cache.set_many(missing, getattr(settings, 'NOTIFICATIONS_STREAM_LINKS_TIMEOUT', DEFAULT_STREAM_LINKS_TIMEOUT))
+
+        return downstream
+
+    def _walk_links(self, stream_id):
+        """Walks the links of the given stream breadth-first.
+
+        It runs one query per level and never visits a stream twice, so cycles
+        are harmless.
+        """
+        through = self.model.linked_streams.through
+        visited = set()
+        frontier = set([stream_id])
+        while frontier:
+            linked = set(through.objects.filter(from_stream_id__in=frontier).values_list('to_stream_id', flat=True))
+            frontier = linked - visited
+            visited.update(frontier)
+        return visited
+
+class ActivityManager(models.Manager):
+    """Manager for activities.
+    """
+    def orphans(self):
+        """Returns the activities which aren't attached to any stream.
+        """
+        return self.filter(streams__isnull=True)
+
+    def exclusive_to(self, stream):
+        """Returns the activities attached to the given stream only.
+        """
+        others = self.model.streams.through.objects.filter(activity_id=OuterRef('pk')).exclude(stream_id=stream.pk)
+        return self.filter(streams=stream).exclude(Exists(others))
 
 class NotificationManager(models.Manager):
     """Manager for notifications.
@@ -30,3 +124,115 @@ class NotificationManager(models.Manager):
 
     def unread(self):
         return self.filter(read__isnull=True)
+
+    def mark_read(self, user, when=None):
+        """Marks all the unread notifications of the given user as read.
+        """
+        count = self.unread().filter(user=user).update(read=when or timezone.now())
+        NotificationCounter = apps.get_model('notifications', 'NotificationCounter')
+        NotificationCounter.objects.rebuild([user.pk])
+        return count
+
+class NotificationCounterManager(models.Manager):
+    """Manager for unread notification counters.
+
+    Counters are also stored in the cache. A missing counter is rebuilt
+    from the notifications the first time it's needed.
+
+    Cached counts are keyed by a version of the user's counter, which is
+    replaced whenever the counter changes: a count read from the database
+    before a change is stored under the former version, so it's never
+    served. Cached counts also expire after NOTIFICATIONS_UNREAD_COUNT_TIMEOUT
+    seconds.
+    """
+    def _version_key(self, user_id):
+        return "%s_%d" % (UNREAD_COUNT_VERSION_KEY, user_id)
+
+    def _cache_key(self, user_id, version):
+        return "notifications:unread_count_%d_%s" % (user_id, version)
+
+    def get_version(self, user_id):
+        """Returns the version of the cached counter of the given user.
+
+        Missing versions are given random values, so a version evicted from
+        the cache is never reused.
+        """
+        keys = [UNREAD_COUNT_VERSION_KEY, self._version_key(user_id)]
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                cache.add(key, uuid.uuid4().hex, None)
+                versions[key] = cache.get(key)
+        return "%s.%s" % tuple([versions[key] for key in keys])
+
+    def get_unread_count(self, user):
+        """Returns the number of unread notifications of the given user.
+        """
+        key = self._cache_key(user.pk, self.get_version(user.pk))
+        count = cache.get(key)
+        if count is None:
+            count = self.filter(user_id=user.pk).values_list('unread', flat=True).first()
+            if count is None:
+                count = self.rebuild([user.pk])[user.pk]
+            cache.set(key, count, getattr(settings, 'NOTIFICATIONS_UNREAD_COUNT_TIMEOUT', DEFAULT_UNREAD_COUNT_TIMEOUT))
+        return count
+
+    def add(self, user_ids, delta=1):
+        """Adds delta to the counters of the given users.
+
+        A user repeated n times gets n * delta. Missing counters are left
+        alone, as they're rebuilt when needed.
+        """
+        users_by_delta = {}
+        for user_id, n in Counter(user_ids).items():
+            users_by_delta.setdefault(n * delta, []).append(user_id)
+        for d, ids in users_by_delta.items():
+            self.filter(user_id__in=ids).update(unread=Greatest(F('unread') + d, 0))
+        self.invalidate(set(user_ids))
+
+    def rebuild(self, user_ids):
+        """Recounts the unread notifications of the given users.
+
+        Returns a dictionary which maps the user ids to their counts.
+        """
+        Notification = apps.get_model('notifications', 'Notification')
+        user_ids = list(user_ids)
+        counts = dict([(uid, 0) for uid in user_ids])
+        counts.update(
+            Notification.objects.filter(user_id__in=user_ids, read__isnull=True)
+                                .order_by()
+                                .values_list('user_id')
+                                .annotate(n=Count('id'))
+        )
+        self.bulk_create(
+            [self.model(user_id=uid, unread=n) for uid, n in counts.items()],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['unread']
+        )
+        self.invalidate(user_ids)
+        return counts
+
+    def invalidate(self, user_ids=None):
+        """Drops the cached counters of the given users (or of all users).
+        """
+        if user_ids is None:
+            cache.set(UNREAD_COUNT_VERSION_KEY, uuid.uuid4().hex, None)
+        else:
+            cache.set_many(dict([(self._version_key(uid), uuid.uuid4().hex) for uid in user_ids]), None)
+
+class OutboxEmailManager(models.Manager):
+    """Manager for outbox e-mails.
+    """
+    def pending(self, max_attempts=None):
+        """Returns the e-mails which are due for a (new) delivery attempt.
+        """
+        queryset = self.filter(sent__isnull=True, next_attempt__lte=timezone.now())
+        if max_attempts is not None:
+            queryset = queryset.filter(attempts__lt=max_attempts)
+        return queryset
+
+    def failed(self, max_attempts):
+        """Returns the e-mails which exhausted all their delivery attempts.
+        """
+        return self.filter(sent__isnull=True, attempts__gte=max_attempts)
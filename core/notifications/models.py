@@ -3,13 +3,17 @@ import hashlib
 from datetime import datetime
 import json
 from django.db import models
-from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _, get_language
+from django.conf import settings
 from django.template.loader import render_to_string
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.validators import validate_slug
 
+from .managers import *
+
 User = get_user_model()
 
 def validate_json(value):
@@ -19,26 +23,45 @@ def validate_json(value):
         raise ValidationError(_('Invalid JSON'))
 
 class Observable(models.Model):
+    """Mix-in which tracks the changes of a model's fields.
+
+    A snapshot of the field values is taken when an object is loaded from the
+    database (or saved) and it's compared with the current values by
+    get_changes. Fields deferred at load time are not tracked.
+    """
     class Meta:
         abstract = True
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.__changes = {}
-        self.__field_cache = {f.name: f for f in self._meta.fields}
-
-    def __setattr__(self, name, value):
-        if self.pk and name in self.__field_cache:
-            field = self.__field_cache[name]
-            label = str(field.verbose_name)
-            if not hasattr(self, '_change_exclude') or name not in self._change_exclude:
-                old_value = field.value_from_object(self)
-                super().__setattr__(name, value)
-                new_value = field.value_from_object(self)
-                if new_value != old_value:
-                    self.__changes[label] = (str(old_value), str(new_value))
-                return
-        super().__setattr__(name, value)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot = dict(zip(field_names, values))
+        return instance
+
+    def take_snapshot(self):
+        """Stores the current field values as the new reference for changes.
+        """
+        self._snapshot = dict([(f.attname, self.__dict__[f.attname]) for f in self._meta.concrete_fields if f.attname in self.__dict__])
+
+    def get_changes(self):
+        """Returns the fields changed since the last snapshot.
+
+        Changes are returned as a dictionary which maps field labels to pairs
+        of old and new values.
+        """
+        changes = {}
+        snapshot = getattr(self, '_snapshot', None)
+        if not snapshot:
+            return changes
+        exclude = getattr(self, '_change_exclude', [])
+        for f in self._meta.concrete_fields:
+            if f.attname not in snapshot or f.name in exclude or f.attname in exclude:
+                continue
+            old_value = snapshot[f.attname]
+            new_value = f.value_from_object(self)
+            if new_value != old_value:
+                changes[str(f.verbose_name)] = (str(old_value), str(new_value))
+        return changes
 
 class Signature(models.Model):
     title = models.CharField(_('title'), max_length=100)
@@ -66,6 +89,8 @@ class Stream(models.Model):
     linked_streams = models.ManyToManyField('self', blank=True, symmetrical=False, related_name='linked_to', verbose_name=_('linked streams'))
     followers = models.ManyToManyField(User, related_name='followed_streams', verbose_name=_('followers'))
 
+    objects = StreamManager()
+
     class Meta:
         verbose_name = _('stream')
         verbose_name_plural = _('streams')
@@ -73,6 +98,33 @@ class Stream(models.Model):
     def __str__(self):
         return self.slug
 
+    def get_owner(self):
+        """Returns the object which the stream belongs to, or None.
+        """
+        for related in self._meta.related_objects:
+            if related.one_to_one:
+                try:
+                    return getattr(self, related.get_accessor_name())
+                except ObjectDoesNotExist:
+                    pass
+        return None
+
+    def is_visible_to(self, user):
+        """Tells whether user can see the activities of the stream.
+
+        Followers can, as well as the users who can view the owner of the
+        stream (like on the pages showing it).
+        """
+        if not user.is_active:
+            return False
+        if user.is_superuser or self.followers.filter(pk=user.pk).exists():
+            return True
+        owner = self.get_owner()
+        if owner is None:
+            return False
+        perm = "%s.view_%s" % (owner._meta.app_label, owner._meta.model_name)
+        return user.has_perm(perm, owner) or user.has_perm(perm)
+
 class Activity(models.Model):
     title = models.CharField(_('title'), max_length=200)
     signature = models.CharField(_('signature'), max_length=50)
@@ -81,11 +133,18 @@ class Activity(models.Model):
     created = models.DateTimeField(auto_now_add=True, verbose_name=_('created'))
     streams = models.ManyToManyField(Stream, related_name='activities', verbose_name=_('streams'))
     backlink = models.URLField(_('backlink'), blank=True, null=True, max_length=200)
+    content = models.TextField(_('content'), blank=True, null=True, editable=False)
+    content_template = models.CharField(_('content template'), blank=True, null=True, max_length=200, editable=False)
+
+    objects = ActivityManager()
 
     class Meta:
         verbose_name = _('activity')
         verbose_name_plural = _('activities')
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['-created', '-id']),
+        ]
 
     def __str__(self):
         try:
@@ -93,11 +152,33 @@ class Activity(models.Model):
         except:
             return self.title
 
+    def get_template_name(self):
+        return self.template or f"notifications/activities/{self.signature}.html"
+
     def get_content(self):
-        template_name = f"notifications/activities/{self.signature}.html"
-        if self.template:
-            template_name = self.template
-        return render_to_string(template_name, self.context or {})
+        """Returns the rendered content of the activity, in the active language.
+
+        Activities never change once created, so the content in the default
+        language is rendered only once and stored with the activity together
+        with the template and the language used to render it. It is rendered
+        again only if the activity is associated with a different template.
+        Content in other languages is rendered every time.
+        """
+        template_name = self.get_template_name()
+        language = get_language() or settings.LANGUAGE_CODE
+        content_template = "%s:%s" % (template_name, language)
+        if self.content is not None and self.content_template == content_template:
+            return self.content
+        context = self.context or {}
+        if isinstance(context, str):
+            context = json.loads(context)
+        content = render_to_string(template_name, context)
+        if language == settings.LANGUAGE_CODE:
+            self.content = content
+            self.content_template = content_template
+            if self.pk:
+                Activity.objects.filter(pk=self.pk).update(content=content, content_template=content_template)
+        return content
 
     def get_absolute_url(self):
         return self.backlink or ""
@@ -111,11 +192,24 @@ class Notification(models.Model):
     read = models.DateTimeField(blank=True, null=True, verbose_name=_('read on'))
     dispatch_uid = models.CharField(max_length=32, verbose_name=_('dispatch UID'))
 
+    objects = NotificationManager()
+
     class Meta:
         verbose_name = _('notification')
         verbose_name_plural = _('notifications')
         ordering = ('-created', 'id')
         get_latest_by = '-created'
+        indexes = [
+            models.Index(fields=['user', 'read']),
+            models.Index(fields=['user', '-created', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'read' in instance.__dict__:
+            instance._was_unread = instance.read is None
+        return instance
 
     def __str__(self):
         return self.title
@@ -134,4 +228,84 @@ class Notification(models.Model):
     def save(self, *args, **kwargs):
         if not self.dispatch_uid:
             self.dispatch_uid = hashlib.md5(f"{self.title}{self.description}{datetime.now()}".encode()).hexdigest()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class NotificationCounter(models.Model):
+    """The number of unread notifications of a user.
+    """
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='notification_counter', verbose_name=_('user'))
+    unread = models.PositiveIntegerField(default=0, verbose_name=_('unread'))
+
+    objects = NotificationCounterManager()
+
+    class Meta:
+        verbose_name = _('notification counter')
+        verbose_name_plural = _('notification counters')
+
+    def __str__(self):
+        return "%s" % self.unread
+
+class OutboxEmail(models.Model):
+    """An e-mail queued for delivery by the send_notification_emails command.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outbox_emails', verbose_name=_('user'))
+    notification = models.ForeignKey(Notification, blank=True, null=True, on_delete=models.SET_NULL, related_name='emails', verbose_name=_('notification'))
+    subject = models.CharField(max_length=100, verbose_name=_('subject'))
+    body = models.TextField(blank=True, null=True, verbose_name=_('body'))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_('created on'))
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True, verbose_name=_('next attempt on'))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_('attempts'))
+    last_error = models.TextField(blank=True, null=True, verbose_name=_('last error'))
+    sent = models.DateTimeField(blank=True, null=True, db_index=True, verbose_name=_('sent on'))
+
+    objects = OutboxEmailManager()
+
+    class Meta:
+        verbose_name = _('outbox e-mail')
+        verbose_name_plural = _('outbox e-mails')
+        ordering = ('next_attempt', 'id')
+
+    def __str__(self):
+        return self.subject
+
+class ArchivedActivity(models.Model):
+    """An activity moved out of the live tables by the compact_notifications command.
+    """
+    activity_id = models.PositiveIntegerField(db_index=True, verbose_name=_('activity'))
+    title = models.CharField(_('title'), max_length=200)
+    signature = models.CharField(_('signature'), max_length=50)
+    context = models.JSONField(_('context'), blank=True, null=True)
+    content = models.TextField(_('content'), blank=True, null=True)
+    created = models.DateTimeField(verbose_name=_('created'))
+    backlink = models.URLField(_('backlink'), blank=True, null=True, max_length=200)
+    stream_ids = models.JSONField(_('streams'), default=list)
+    archived = models.DateTimeField(auto_now_add=True, verbose_name=_('archived on'))
+
+    class Meta:
+        verbose_name = _('archived activity')
+        verbose_name_plural = _('archived activities')
+        ordering = ('-created',)
+
+    def __str__(self):
+        return self.title
+
+class ArchivedNotification(models.Model):
+    """A read notification moved out of the live tables by the compact_notifications command.
+    """
+    notification_id = models.PositiveIntegerField(db_index=True, verbose_name=_('notification'))
+    title = models.CharField(max_length=100, verbose_name=_('title'))
+    description = models.TextField(blank=True, null=True, verbose_name=_('description'))
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications', verbose_name=_('user'))
+    signature = models.ForeignKey(Signature, on_delete=models.CASCADE, related_name='archived_notifications', verbose_name=_('signature'))
+    created = models.DateTimeField(verbose_name=_('created on'))
+    read = models.DateTimeField(blank=True, null=True, verbose_name=_('read on'))
+    dispatch_uid = models.CharField(max_length=32, verbose_name=_('dispatch UID'))
+    archived = models.DateTimeField(auto_now_add=True, verbose_name=_('archived on'))
+
+    class Meta:
+        verbose_name = _('archived notification')
+        verbose_name_plural = _('archived notifications')
+        ordering = ('-created', 'id')
+
+    def __str__(self):
+        return self.title
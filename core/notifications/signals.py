@@ -21,17 +21,23 @@ __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
 import django.dispatch
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
-from django.core.mail import EmailMessage
 from django.contrib.auth.models import User
 from django_comments.models import Comment
-from django.conf import settings
 
 from .core.auth.models import MyPermission, ObjectPermission
 from .core.auth.cache import LoggedInUserCache
 
+from core.utils import provide_lazily, peek_relation, save_relation
+
 from .models import *
+from .fanout import fan_out
+
+managed_stream_models = []
+
+# Max number of objects listed by the activity of a many-to-many change.
+M2M_ACTIVITY_MAX_ITEMS = 20
 
 ## UTILS ##
 
@@ -52,19 +58,46 @@ def register_activity_to_stream(activity, stream):
     except:
         activity.streams.add(stream)
 
+def queue_emails(notifications):
+    """Queues the given notifications in the e-mail outbox.
+
+    Rows are written only when the current transaction commits, so rolled back
+    notifications are never sent. Delivery is left to the
+    send_notification_emails command.
+    """
+    emails = [
+        OutboxEmail(
+            user_id=n.user_id,
+            notification_id=n.pk,
+            subject=n.title,
+            body=n.description
+        )
+        for n in notifications
+    ]
+    if emails:
+        transaction.on_commit(lambda: OutboxEmail.objects.bulk_create(emails))
+
 def manage_stream(cls):
     """Connects handlers for stream management.
+
+    Streams are created the first time they're accessed. Use the
+    create_streams command to create them in bulk for existing objects.
     """
-    models.signals.post_save.connect(create_stream, cls, dispatch_uid="%s_stream_creation" % cls.__name__)
+    if cls not in managed_stream_models:
+        managed_stream_models.append(cls)
+    provide_lazily(cls, "stream", create_stream)
     models.signals.post_delete.connect(delete_stream, cls, dispatch_uid="%s_stream_deletion" % cls.__name__)
 
 def make_observable(cls, exclude=['stream_id', 'dashboard_id', 'modified']):
     """Adds Observable mix-in to the given class.
     """
-    if Observable not in cls.__bases__:
+    if not issubclass(cls, Observable):
         class _Observable(Observable):
-            __change_exclude = exclude
-        cls.__bases__ += (_Observable,)
+            _change_exclude = exclude
+
+            class Meta:
+                abstract = True
+        cls.__bases__ = (_Observable,) + cls.__bases__
     models.signals.post_save.connect(notify_changes, sender=cls, dispatch_uid="%s_notify_changes" % cls.__name__)
 
 ## HANDLERS ##
@@ -191,20 +224,65 @@ def notify_object_deleted(sender, instance, *args, **kwargs):
         pass
 
 def notify_m2m_changed(sender, instance, action, reverse, model, pk_set, *args, **kwargs):
-    """Generates one or more activities related to the change of an existing many-to-many relationship.
+    """Generates an activity related to the change of an existing many-to-many relationship.
+
+    A single activity summarizes all the objects added or removed by the
+    change, whatever their number: only the first M2M_ACTIVITY_MAX_ITEMS of
+    them are loaded and listed.
     """
-    create_stream(sender, instance)
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
 
-    try:            
+    try:
         stream = kwargs.get('stream', instance.stream)
 
+        author = LoggedInUserCache().current_user
+        pks = sorted(pk_set)[:M2M_ACTIVITY_MAX_ITEMS]
+        objects = model._default_manager.in_bulk(pks)
+        items = []
+        for obj in [objects[pk] for pk in pks if pk in objects]:
+            item = {"name": "%s" % obj}
+            if hasattr(obj, "get_absolute_url"):
+                item["link"] = obj.get_absolute_url()
+            items.append(item)
+
         if action == "post_add":
-            for pk in pk_set:
-                notify_object_created(sender=model, instance=model.objects.get(pk=pk), stream=stream)
+            title = _("%(count)d %(class)s added to %(name)s")
+            author_title = _("%(count)d %(class)s added to %(name)s by %(author)s")
+            signature = "%s-created" % model.__name__.lower()
+        else:
+            title = _("%(count)d %(class)s removed from %(name)s")
+            author_title = _("%(count)d %(class)s removed from %(name)s by %(author)s")
+            signature = "%s-deleted" % model.__name__.lower()
+
+        context = {
+            "class": "%s" % model._meta.verbose_name_plural,
+            "name": "%s" % instance,
+            "link": instance.get_absolute_url(),
+            "count": len(pk_set),
+            "action": action[5:],
+            "objects": items,
+            "others": len(pk_set) - len(items),
+        }
+
+        register_follower_to_stream(author, stream)
+
+        if author:
+            title = author_title
+            context.update({
+                "author": "%s" % author,
+                "author_link": author.get_absolute_url()
+            })
 
-        elif action == "post_remove":
-            for pk in pk_set:
-                notify_object_deleted(sender=model, instance=model.objects.get(pk=pk), stream=stream)
+        activity = Activity.objects.create(
+            title=title,
+            signature=signature,
+            template="notifications/activities/m2m-changed.html",
+            context=json.dumps(context),
+            backlink=instance.get_absolute_url()
+        )
+
+        register_activity_to_stream(activity, stream)
 
     except:
         pass
@@ -279,29 +357,37 @@ def notify_changes(sender, instance, **kwargs):
     
     Changes are notified sending a "post_change" signal.
     """
+    if not isinstance(instance, Observable):
+        return
     if not kwargs['created']:
-        try:
-            changes = {}
-            for name, (old_value, value) in instance._Observable__changes.items():
-                if value != old_value:
-                    changes[name] = (old_value, value)  
-            instance._Observable__changes = {}
-            if changes:
-                post_change.send(sender=sender, instance=instance, changes=changes)
-        except AttributeError:
-            pass
+        changes = instance.get_changes()
+        if changes:
+            post_change.send(sender=sender, instance=instance, changes=changes)
+    instance.take_snapshot()
 
 def forward_activity(sender, instance, action, reverse, model, pk_set, **kwargs):
     """Forwards a new activity to all the linked streams.
+
+    The activity is attached to the whole downstream set with a single bulk
+    insert, which doesn't trigger this handler again.
     """
     if not isinstance(instance, Activity):
         return
 
-    if action == "post_add":
-        for stream_id in pk_set:
-            stream = Stream.objects.get(id=stream_id)
-            for s in stream.linked_streams.all():
-                s.activity_set.add(instance)       
+    if action == "post_add" and pk_set:
+        through = Activity.streams.through
+        downstream = Stream.objects.downstream_of(pk_set) - set(pk_set)
+        through.objects.bulk_create(
+            [through(activity_id=instance.pk, stream_id=stream_id) for stream_id in downstream],
+            ignore_conflicts=True
+        )
+
+def invalidate_stream_links(sender, instance, *args, **kwargs):
+    """Invalidates the cached stream links when they change.
+    """
+    action = kwargs.get('action', None)
+    if action is None or action.startswith("post_"):
+        Stream.objects.bump_links_version()
 
 def notify_activity(sender, instance, action, *args, **kwargs):
     """Notifies a new activity to all the followers of the related streams.
@@ -310,28 +396,15 @@ def notify_activity(sender, instance, action, *args, **kwargs):
         return
 
     activity = instance
-    content = activity.get_content()
 
     # Notifies an activity to all the followers.
     if action == "post_add":
-        subscriptions = Subscription.objects.filter(signature__slug=activity.signature).distinct()
-        streams = activity.streams.all()
-        for subscription in subscriptions:
-            for stream in streams:
-                if subscription.user in stream.followers.all():
-                    notification, is_new = Notification.objects.get_or_create(
-                        signature=subscription.signature,
-                        user=subscription.user,
-                        description=content,
-                        title=u"%s" % activity,
-                        dispatch_uid="%d" % activity.id,
-                    )
-                    break
+        report = fan_out(activity)
+        queue_emails(report.emails)
 
     # Deletes orphans.
     elif action in ["post_remove", "post_clear"]:
-        streams = activity.streams.all()
-        if len(streams) == 0:
+        if not activity.streams.exists():
             activity.delete()
 
 def clear_orphans(sender, instance, *args, **kwargs):
@@ -341,10 +414,7 @@ def clear_orphans(sender, instance, *args, **kwargs):
         return
 
     # Deletes orphans.
-    for activity in instance.activity_set.all():
-        streams = activity.streams.all()
-        if len(streams) == 1 and streams[0] == instance:
-            activity.delete()
+    Activity.objects.exclusive_to(instance).delete()
 
 def create_stream(sender, instance, *args, **kwargs):
     """Creates a new stream for the given object.
@@ -352,28 +422,46 @@ def create_stream(sender, instance, *args, **kwargs):
     if hasattr(instance, "stream") and not instance.stream:
         stream, is_new = Stream.objects.get_or_create(slug="%s_%d_stream" % (sender.__name__.lower(), instance.pk))
         if not is_new:
-            for a in stream.activities.all():
-                a.delete()
+            stream.activities.all().delete()
         stream_attach.send(sender=sender, instance=instance, stream=stream)
         instance.stream = stream
-        instance.save()
+        save_relation(instance, "stream")
 
 def delete_stream(sender, instance, *args, **kwargs):
     """Deletes the stream of the given object.
     """
-    stream = instance.stream
+    stream = peek_relation(instance, "stream")
     if stream:
         stream.delete()
         instance.stream = None
 
+def count_notification(sender, instance, *args, **kwargs):
+    """Updates the unread counter of the user of a saved notification.
+    """
+    is_unread = instance.read is None
+    if kwargs['created']:
+        if is_unread:
+            NotificationCounter.objects.add([instance.user_id], 1)
+    else:
+        was_unread = getattr(instance, '_was_unread', None)
+        if was_unread is None:
+            NotificationCounter.objects.rebuild([instance.user_id])
+        elif was_unread != is_unread:
+            NotificationCounter.objects.add([instance.user_id], 1 if is_unread else -1)
+    instance._was_unread = is_unread
+
+def uncount_notification(sender, instance, *args, **kwargs):
+    """Updates the unread counter of the user of a deleted notification.
+    """
+    if instance.read is None:
+        NotificationCounter.objects.add([instance.user_id], -1)
+
 def send_notification_email(sender, instance, signal, *args, **kwargs):
-    if Subscription.objects.filter(signature=instance.signature, user=instance.user, send_email=True).count() > 0:
-        email_subject = instance.title
-        email_body = instance.description
-        email_from = getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@localhost.com')
-        email = EmailMessage(email_subject, email_body, email_from, [instance.user.email,])
-        email.content_subtype = "html"
-        email.send()
+    """Queues an e-mail for a new notification, if its user asked for it.
+    """
+    if kwargs.get('created') \
+    and Subscription.objects.filter(signature=instance.signature, user=instance.user, send_email=True).exists():
+        queue_emails([instance])
 
 ## SIGNALS ##
 
@@ -385,9 +473,13 @@ stream_attach = django.dispatch.Signal(providing_args=["instance", "stream"])
 models.signals.post_save.connect(update_user_permissions, sender=User, dispatch_uid="update_user_permissions")
 models.signals.m2m_changed.connect(forward_activity, sender=Activity.streams.through, dispatch_uid="forward_activities")
 models.signals.m2m_changed.connect(notify_activity, sender=Activity.streams.through, dispatch_uid="notify_activities")
+models.signals.m2m_changed.connect(invalidate_stream_links, sender=Stream.linked_streams.through, dispatch_uid="invalidate_stream_links")
+models.signals.post_delete.connect(invalidate_stream_links, sender=Stream, dispatch_uid="invalidate_stream_links")
 models.signals.pre_delete.connect(clear_orphans, sender=Stream, dispatch_uid="clear_orphans")
 
 models.signals.post_save.connect(notify_comment_created, Comment, dispatch_uid="comment_created")
 models.signals.post_delete.connect(notify_comment_deleted, Comment, dispatch_uid="comment_deleted")
 
+models.signals.post_save.connect(count_notification, Notification, dispatch_uid="count_notification")
+models.signals.post_delete.connect(uncount_notification, Notification, dispatch_uid="uncount_notification")
 models.signals.post_save.connect(send_notification_email, Notification)
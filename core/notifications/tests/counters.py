@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from core.notifications.models import *
+from core.notifications.managers import UNREAD_COUNT_VERSION_KEY
+
+class NotificationCounterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.signature = Signature.objects.create(title="Counted", slug="counted")
+        self.user = User.objects.create(username="counted")
+        self.other = User.objects.create(username="counted_other")
+
+    def notify(self, user=None, read=None):
+        return Notification.objects.create(user=user or self.user, signature=self.signature, title="Counted", read=read)
+
+    def assertCounted(self, user=None):
+        user = user or self.user
+        expected = Notification.objects.filter(user=user, read__isnull=True).count()
+        self.assertEqual(NotificationCounter.objects.get_unread_count(user), expected)
+        self.assertEqual(NotificationCounter.objects.get(user=user).unread, expected)
+        return expected
+
+    def test_create_and_delete(self):
+        self.assertEqual(self.assertCounted(), 0)
+        n1, n2 = self.notify(), self.notify()
+        self.notify(read=timezone.now())
+        self.notify(user=self.other)
+        self.assertEqual(self.assertCounted(), 2)
+        self.assertEqual(self.assertCounted(self.other), 1)
+        n1.delete()
+        self.assertEqual(self.assertCounted(), 1)
+        Notification.objects.filter(read__isnull=False).get().delete()
+        self.assertEqual(self.assertCounted(), 1)
+
+    def test_read_toggles(self):
+        self.assertCounted()
+        n = self.notify()
+        self.assertEqual(self.assertCounted(), 1)
+        n.read = timezone.now()
+        n.save()
+        self.assertEqual(self.assertCounted(), 0)
+        n.save()
+        self.assertEqual(self.assertCounted(), 0)
+        # Loaded from the database, the notification remembers it was read.
+        n = Notification.objects.get(pk=n.pk)
+        n.read = None
+        n.save()
+        self.assertEqual(self.assertCounted(), 1)
+
+    def test_unknown_previous_state(self):
+        self.assertCounted()
+        n = self.notify()
+        n = Notification.objects.only('id', 'user').get(pk=n.pk)
+        Notification.objects.filter(pk=n.pk).update(read=timezone.now())
+        # Without the former value of "read", the counter is rebuilt.
+        n.title = "Renamed"
+        n.save(update_fields=['title'])
+        self.assertEqual(self.assertCounted(), 0)
+
+    def test_bulk_update(self):
+        for i in range(3):
+            self.notify()
+        self.assertEqual(self.assertCounted(), 3)
+        # update() bypasses the signals: mark_read rebuilds the counter.
+        self.assertEqual(Notification.objects.mark_read(self.user), 3)
+        self.assertEqual(self.assertCounted(), 0)
+        Notification.objects.filter(user=self.user).update(read=None)
+        NotificationCounter.objects.rebuild([self.user.pk])
+        self.assertEqual(self.assertCounted(), 3)
+
+    def test_rebuild(self):
+        self.notify()
+        self.notify(user=self.other)
+        NotificationCounter.objects.filter(user=self.user).update(unread=42)
+        NotificationCounter.objects.filter(user=self.other).delete()
+        counts = NotificationCounter.objects.rebuild([self.user.pk, self.other.pk])
+        self.assertEqual(counts, {self.user.pk: 1, self.other.pk: 1})
+        self.assertEqual(NotificationCounter.objects.filter(user__in=[self.user, self.other]).count(), 2)
+        self.assertCounted()
+        self.assertCounted(self.other)
+
+    def test_missing_counter(self):
+        self.notify()
+        NotificationCounter.objects.filter(user=self.user).delete()
+        self.assertEqual(self.assertCounted(), 1)
+
+    def test_evicted_version_key(self):
+        self.notify()
+        self.assertEqual(self.assertCounted(), 1)
+        version = NotificationCounter.objects.get_version(self.user.pk)
+        self.notify()
+        # A slow reader stores the count it read before the change...
+        cache.set(NotificationCounter.objects._cache_key(self.user.pk, version), 1, None)
+        self.assertEqual(self.assertCounted(), 2)
+        # ...and evicted versions never match it again.
+        cache.delete_many([UNREAD_COUNT_VERSION_KEY, "%s_%d" % (UNREAD_COUNT_VERSION_KEY, self.user.pk)])
+        self.assertNotEqual(NotificationCounter.objects.get_version(self.user.pk), version)
+        self.assertEqual(self.assertCounted(), 2)
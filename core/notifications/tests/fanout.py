@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+
+from core.notifications.models import *
+from core.notifications.fanout import resolve_subscriptions, fan_out
+
+class FanOutTestCase(TestCase):
+    def setUp(self):
+        self.signature = Signature.objects.create(title="Event created", slug="event-created")
+        self.s1 = Stream.objects.create(slug="fanout-1")
+        self.s2 = Stream.objects.create(slug="fanout-2")
+        self.users = [User.objects.create(username="fanout%d" % i) for i in range(5)]
+        u0, u1, u2, u3, u4 = self.users
+        # u1 follows both streams, u3 none and u4 isn't subscribed.
+        self.s1.followers.add(u0, u1)
+        self.s2.followers.add(u1, u2, u4)
+        for user, send_email in ((u0, True), (u1, False), (u2, True), (u3, True)):
+            Subscription.objects.create(user=user, signature=self.signature, send_email=send_email)
+        self.activity = self.create_activity()
+
+    def create_activity(self):
+        activity = Activity.objects.create(title="Event", signature="event-created")
+        # Attached without signals, which would fan the activity out.
+        Activity.streams.through.objects.bulk_create([
+            Activity.streams.through(activity=activity, stream=stream) for stream in (self.s1, self.s2)
+        ])
+        return activity
+
+    def notified(self, activity):
+        return sorted(Notification.objects.filter(dispatch_uid="%d" % activity.pk).values_list('user__username', flat=True))
+
+    def test_resolve_subscriptions(self):
+        with self.assertNumQueries(1):
+            users = [s.user.username for s in resolve_subscriptions(self.activity)]
+        self.assertEqual(sorted(users), ["fanout0", "fanout1", "fanout2"])
+
+    def test_fan_out(self):
+        report = fan_out(self.activity, "<p>Event</p>")
+        self.assertEqual(report.activity, self.activity)
+        self.assertEqual(len(report.notifications), 3)
+        self.assertEqual(sorted([n.user.username for n in report.emails]), ["fanout0", "fanout2"])
+        self.assertTrue(report.resolve_time >= 0 and report.write_time >= 0)
+        self.assertEqual(self.notified(self.activity), ["fanout0", "fanout1", "fanout2"])
+        n = Notification.objects.get(user=self.users[0])
+        self.assertEqual((n.title, n.description, n.signature), ("Event", "<p>Event</p>", self.signature))
+
+    def test_already_notified(self):
+        fan_out(self.activity, "<p>Event</p>")
+        report = fan_out(self.activity, "<p>Event</p>")
+        self.assertEqual((len(report.notifications), len(report.emails)), (0, 0))
+        self.assertEqual(self.notified(self.activity), ["fanout0", "fanout1", "fanout2"])
+        # Only the users notified about another activity are skipped.
+        Notification.objects.filter(user=self.users[0]).delete()
+        report = fan_out(self.activity, "<p>Event</p>")
+        self.assertEqual([n.user_id for n in report.notifications], [self.users[0].pk])
+
+    def test_duplicate_subscriptions(self):
+        Subscription.objects.create(user=self.users[0], signature=self.signature, send_email=False)
+        report = fan_out(self.activity, "<p>Event</p>")
+        self.assertEqual(len(report.notifications), 3)
+        self.assertEqual(self.notified(self.activity), ["fanout0", "fanout1", "fanout2"])
+
+    def test_query_count(self):
+        with CaptureQueriesContext(connection) as few:
+            fan_out(self.activity, "<p>Event</p>")
+        for i in range(20):
+            user = User.objects.create(username="fanout_more%d" % i)
+            self.s1.followers.add(user)
+            Subscription.objects.create(user=user, signature=self.signature)
+        activity = self.create_activity()
+        with CaptureQueriesContext(connection) as many:
+            report = fan_out(activity, "<p>Event</p>")
+        self.assertEqual(len(report.notifications), 23)
+        self.assertEqual(len(many), len(few))
+
+    @override_settings(NOTIFICATIONS_FANOUT_BATCH_SIZE=2)
+    def test_batch_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = fan_out(self.activity, "<p>Event</p>")
+        table = connection.ops.quote_name(Notification._meta.db_table)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO %s ' % table)]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(len(report.notifications), 3)
+        self.assertTrue(all(n.pk for n in report.notifications))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import json
+
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.contrib.auth.models import User, AnonymousUser
+from django.utils import timezone
+from django.conf import settings
+
+from core.authorize.models import ObjectPermission
+from core.calendar.models import Event
+from core.notifications.models import Stream, Activity
+from core.notifications.managers import STREAM_LINKS_VERSION_KEY
+from core.notifications.views.streams import stream_activities
+
+TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'DIRS': [settings.THEME_PATH + '/templates'],
+    'APP_DIRS': True,
+}]
+
+@override_settings(TEMPLATES=TEMPLATES)
+class StreamActivitiesTestCase(TestCase):
+    def setUp(self):
+        self.stream = Stream.objects.create(slug="event-stream")
+        self.event = Event(title="Event", start=timezone.now(), stream=self.stream)
+        self.event.save()
+        activity = Activity.objects.create(title="Event created", signature="event-created", template="notifications/activities/object-created.html", context={"name": "Event"})
+        activity.streams.add(self.stream)
+        self.user = User.objects.create(username="stream_user")
+        self.other = User.objects.create(username="stream_other")
+
+    def get(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return stream_activities(request, self.stream.slug)
+
+    def assertActivities(self, response):
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual([a['title'] for a in data['objects']], ["Event created"])
+        self.assertEqual(data['next'], None)
+
+    def test_owner_permission(self):
+        ObjectPermission.objects.grant(["view_event"], [self.event], users=[self.user])
+        self.assertActivities(self.get(User.objects.get(pk=self.user.pk)))
+
+    def test_follower(self):
+        self.stream.followers.add(self.user)
+        self.assertActivities(self.get(User.objects.get(pk=self.user.pk)))
+
+    def test_not_allowed(self):
+        ObjectPermission.objects.grant(["view_event"], [self.event], users=[self.user])
+        self.assertRaises(PermissionDenied, self.get, User.objects.get(pk=self.other.pk))
+
+    def test_other_stream(self):
+        other_stream = Stream.objects.create(slug="other-event-stream")
+        Event(title="Other", start=timezone.now(), stream=other_stream).save()
+        ObjectPermission.objects.grant(["view_event"], [self.event], users=[self.user])
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=self.user.pk)
+        self.assertRaises(PermissionDenied, stream_activities, request, other_stream.slug)
+
+    def test_anonymous(self):
+        response = self.get(AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+
+class StreamLinksTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a, self.b, self.c = [Stream.objects.create(slug="links-%s" % name) for name in "abc"]
+        self.a.linked_streams.add(self.b)
+
+    def test_downstream(self):
+        self.assertEqual(Stream.objects.downstream_of([self.a.pk]), set([self.b.pk]))
+        self.b.linked_streams.add(self.c)
+        Stream.objects.bump_links_version()
+        self.assertEqual(Stream.objects.downstream_of([self.a.pk]), set([self.b.pk, self.c.pk]))
+
+    def test_evicted_version_key(self):
+        self.assertEqual(Stream.objects.downstream_of([self.a.pk]), set([self.b.pk]))
+        self.b.linked_streams.add(self.c)
+        Stream.objects.bump_links_version()
+        # A version evicted after the change must not match the cached sets.
+        cache.delete(STREAM_LINKS_VERSION_KEY)
+        self.assertEqual(Stream.objects.downstream_of([self.a.pk]), set([self.b.pk, self.c.pk]))
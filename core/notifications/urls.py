@@ -27,9 +27,11 @@ urlpatterns = patterns('.core.notifications.views',
     # Streams.
     url(r'^streams/follow/(?P<slug>[-\w]+)/?next=(?P<path>[\d\w\-\_\/]+)$', view='streams.stream_follow', name='stream_follow'),
     url(r'^streams/leave/(?P<slug>[-\w]+)/?next=(?P<path>[\d\w\-\_\/]+)$', view='streams.stream_leave', name='stream_leave'),
+    url(r'^streams/(?P<slug>[-\w]+)/activities/$', view='streams.stream_activities', name='stream_activities'),
 
     # Notifications.
     url(r'^users/(?P<username>[\w\d\@\.\+\-\_]+)/notifications/$', view='notifications.notification_list', name='notification_list'),
+    url(r'^users/(?P<username>[\w\d\@\.\+\-\_]+)/notifications/feed/$', view='notifications.notification_feed', name='notification_feed'),
     url(r'^users/(?P<username>[\w\d\@\.\+\-\_]+)/notifications/(?P<id>\d+)/$', view='notifications.notification_detail', name='notification_detail'),
     url(r'^users/(?P<username>[\w\d\@\.\+\-\_]+)/notifications/(?P<id>\d+)/delete/$', view='notifications.notification_delete', name='notification_delete'),
 )
@@ -23,6 +23,7 @@ __version__ = '0.0.5'
 from datetime import datetime
 
 from django.shortcuts import render_to_response, get_object_or_404
+from django.http import JsonResponse
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import list_detail, create_update
 from django.views.generic.simple import redirect_to
@@ -34,7 +35,8 @@ from django.conf import settings
 
 from .core.auth.views import _get_user
 from .core.auth.decorators import obj_permission_required as permission_required
-from .core.views import filtered_list_detail
+from core.utils import filter_objects
+from core.utils.paginator import KeysetPaginator, InvalidCursor
 
 from ..models import *
 from ..forms import *
@@ -44,10 +46,22 @@ def _get_notification(request, *args, **kwargs):
     id = kwargs.get('id', None)
     return get_object_or_404(Notification, user__username=username, id=id)
 
+def _paginate_notifications(request, queryset, paginate_by):
+    try:
+        paginator = KeysetPaginator(queryset, paginate_by)
+    except ValueError:
+        paginator = KeysetPaginator(queryset.order_by(*Notification._meta.ordering), paginate_by)
+    try:
+        return paginator.page(request.GET.get('cursor', None))
+    except InvalidCursor:
+        return paginator.page()
+
 @permission_required('auth.change_user', _get_user)
 @permission_required('notifications.view_notification')
-def notification_list(request, username, page=0, paginate_by=10, **kwargs):
+def notification_list(request, username, paginate_by=10, template_name='notifications/notification_list.html', **kwargs):
     """Displays the list of all filtered notifications.
+
+    Notifications are paginated by cursor (see notification_feed).
     """
     user = get_object_or_404(User, username=username)
     
@@ -63,18 +77,46 @@ def notification_list(request, username, page=0, paginate_by=10, **kwargs):
         else:
             form = None
 
-    return filtered_list_detail(
+    field_names, filter_fields, object_list = filter_objects(
         request,
         Notification.objects.filter(user=user),
-        fields=['title', 'created', 'read'],
-        paginate_by=paginate_by,
-        page=page,
-        extra_context={
-            'form' : form,
-            'object': user,
-        },
-        **kwargs
+        fields=['title', 'created', 'read']
     )
+    page = _paginate_notifications(request, object_list, paginate_by)
+
+    return render_to_response(template_name, RequestContext(request, {
+        'field_names': field_names,
+        'filter_fields': filter_fields,
+        'object_list': page.object_list,
+        'page_obj': page,
+        'form' : form,
+        'object': user,
+    }))
+
+@permission_required('auth.change_user', _get_user)
+@permission_required('notifications.view_notification')
+def notification_feed(request, username, paginate_by=20, **kwargs):
+    """Returns a page of notifications as JSON, for infinite scrolling.
+
+    The "next" URL is null when there are no more notifications.
+    """
+    user = get_object_or_404(User, username=username)
+    page = _paginate_notifications(request, Notification.objects.filter(user=user), paginate_by)
+
+    next_url = None
+    if page.has_next():
+        next_url = "%s?cursor=%s" % (reverse('notification_feed', args=[user.username]), page.next_cursor)
+
+    return JsonResponse({
+        'objects': [{
+            'id': n.pk,
+            'title': n.title,
+            'created': n.created,
+            'read': n.read,
+            'url': n.get_absolute_url(),
+        } for n in page],
+        'next': next_url,
+    })
 
 @permission_required('auth.view_user', _get_user)
 @permission_required('notifications.view_notification', _get_notification)
@@ -21,11 +21,17 @@ __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
 from django.shortcuts import get_object_or_404
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.views.generic.simple import redirect_to
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 
+from core.utils.paginator import KeysetPaginator, InvalidCursor
+
 from ..models import *
 
 @login_required
@@ -54,4 +60,36 @@ def stream_leave(request, slug, path='/', **kwargs):
 
     return redirect_to(request, permanent=False, url=path)
 
-    
+
+@login_required
+def stream_activities(request, slug, paginate_by=20, **kwargs):
+    """Returns a page of the activities of the given stream as JSON.
+
+    Pages are addressed by cursor, for infinite scrolling. The "next" URL is
+    null when there are no more activities. Only the users who can see the
+    stream (see Stream.is_visible_to) get its activities.
+    """
+    stream = get_object_or_404(Stream, slug=slug)
+    if not stream.is_visible_to(request.user):
+        raise PermissionDenied
+    paginator = KeysetPaginator(stream.activities.all(), paginate_by)
+    try:
+        page = paginator.page(request.GET.get('cursor', None))
+    except InvalidCursor:
+        page = paginator.page()
+
+    next_url = None
+    if page.has_next():
+        next_url = "%s?cursor=%s" % (reverse('stream_activities', args=[stream.slug]), page.next_cursor)
+
+    return JsonResponse({
+        'objects': [{
+            'id': a.pk,
+            'title': "%s" % a,
+            'created': a.created,
+            'url': a.get_absolute_url(),
+            'content': a.get_content(),
+        } for a in page],
+        'html': render_to_string('elements/timeline_items.html', {'object_list': page.object_list}, request),
+        'next': next_url,
+    })
@@ -21,9 +21,14 @@ __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
 import re
+import ast
+import logging
+from functools import lru_cache
 
-from django.db import models
+from django.conf import settings
+from django.db import models, connections, router
 from django import forms
+from django.forms.boundfield import BoundField
 from django.forms.utils import pretty_name
 
 from django.forms.utils import flatatt
@@ -31,12 +36,18 @@ from django import template
 from django.template.loader import render_to_string
 from django.template import Node, NodeList, Variable, Library
 from django.template import TemplateSyntaxError, VariableDoesNotExist
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, get_language
 from django.utils.safestring import mark_safe
 from django.contrib.contenttypes.models import ContentType
 
 from core.templatetags import parse_args_kwargs
-from core.utils import is_visible, value_to_string, field_to_value, field_to_string
+from core.utils import value_to_string, field_to_string
+from core.utils import table_fields, plan_related, QueryCounter
+from core.utils.formatters import value_formatter
+from core.authorize.managers import visible_to
+from core.authorize.backends import get_object_perms_for
+
+logger = logging.getLogger(__name__)
 
 register = template.Library()
 
@@ -80,15 +91,15 @@ def row_template(index):
         return u'\t<tr class="altrow">\n'
     return u'\t<tr>\n'
 
-def field_template(name, field, form_or_model, attrs={}, suffix=""):
+def field_template(name, field, form_or_model, attrs={}, suffix="", value=None):
     label = ""
-    value = ""
     output = ""
     td_attrs = {}
 
     if isinstance(field, models.Field):
         label = u'%s' % field.verbose_name
-        value = field_to_string(field, form_or_model)
+        if value is None:
+            value = field_to_string(field, form_or_model)
 
     elif isinstance(field, forms.Field):
         bf = BoundField(form_or_model, field, name)
@@ -96,9 +107,9 @@ def field_template(name, field, form_or_model, attrs={}, suffix=""):
         value = u'%s' % bf
         if bf.help_text:
             value += '<br/>\n<span class="help_text">%s</span>' % (u'%s' % bf.help_text)
-        if bf._errors():
+        if bf.errors:
             value += '<br/>\n<ul class="errorlist">\n'
-            for error in bf._errors():
+            for error in bf.errors:
                 value += '\t<li>%s</li>\n' % error
             value += '</ul>\n'
         css_classes = bf.css_classes()
@@ -108,6 +119,7 @@ def field_template(name, field, form_or_model, attrs={}, suffix=""):
     else:
         name = _(pretty_name(name).lower())
         label = u'%s' % name.capitalize()
+        value = ""
         if callable(field):
             value = value_to_string(field())
         else:
@@ -123,55 +135,159 @@ def field_template(name, field, form_or_model, attrs={}, suffix=""):
 
     return output
 
+# Primary key used to reverse the URLs of a model once, then filled with the
+# pk of each row.
+URL_PLACEHOLDER = 2147483646
+
+class QueryBlocked(Exception):
+    pass
+
+def block_queries(execute, sql, params, many, context):
+    raise QueryBlocked(sql)
+
+@lru_cache(maxsize=None)
+def url_template(model, method):
+    """Returns the (prefix, suffix) around the pk in the URL given by method
+    for objects of model, or None if the URL doesn't depend on the pk alone.
+
+    The URL is reversed on an object having only its pk loaded, with queries
+    blocked: reading any other field would load it from the database, so
+    methods using more than the pk are left out.
+    """
+    pk = model._meta.pk
+    if not isinstance(pk.target_field if pk.is_relation else pk, models.IntegerField):
+        return None
+    db = router.db_for_read(model)
+    try:
+        instance = model.from_db(db, [pk.attname], [URL_PLACEHOLDER])
+        with connections[db].execute_wrapper(block_queries):
+            url = getattr(instance, method)()
+    except Exception:
+        return None
+    marker = str(URL_PLACEHOLDER)
+    if not isinstance(url, str) or url.count(marker) != 1:
+        return None
+    prefix, marker, suffix = url.partition(marker)
+    return prefix, suffix
+
+def url_builder(model, method, samples=()):
+    """Returns a function giving the URL of method for objects of model.
+
+    The URL is pre-reversed with a placeholder pk if it depends on the pk
+    alone and matches the real URL of each sample object; otherwise method
+    is called for every object.
+    Returns None if model has no such method.
+    """
+    if not hasattr(model, method):
+        return None
+    template = url_template(model, method)
+    if template is not None:
+        prefix, suffix = template
+        try:
+            if all(getattr(o, method)() == u'%s%s%s' % (prefix, o.pk, suffix) for o in samples):
+                return lambda instance: u'%s%s%s' % (prefix, instance.pk, suffix)
+        except Exception:
+            pass
+    return lambda instance: getattr(instance, method)()
+
+@lru_cache(maxsize=256)
+def compile_columns(fields, language):
+    """Returns the cell formatters of the given fields in language.
+    """
+    return tuple([value_formatter(f) for f in fields])
+
+class DetailTableRendering(object):
+    """The state of a single rendering of a detail table.
+
+    Template nodes are shared by all the threads rendering a cached
+    template, so this state is kept apart and passed around instead.
+    """
+    def __init__(self, request, object_list=(), field_list=()):
+        self.request = request
+        self.object_list = object_list
+        self.field_list = field_list
+        self.object_perms = None
+        self.formatters = ()
+        self.absolute_url = self.edit_url = self.delete_url = None
+        self.labels = {"edit": _('Edit'), "delete": _('Delete')}
+
 class DetailTableNode(Node):
     def __init__(self, *args, **kwargs):
         self.args = [Variable(arg) for arg in args]
         self.kwargs = dict([(k, Variable(arg)) for k, arg in kwargs.items()])
-        self.object_list = []
-        self.field_list = []
 
-    def render_with_args(self, context, object_list, fields=[], exclude=[], *args, **kwargs):
-        self.object_list = object_list
-        self.request = context['request']
-        url = './?' + ''.join(['%s=%s&' % (key, value) for key, value in self.request.GET.items() if key != "order_by"])
+    def render_with_args(self, context, object_list, fields=[], exclude=[], perm=None, *args, **kwargs):
+        request = context['request']
+        restrict = perm and isinstance(object_list, models.QuerySet)
+        if restrict and object_list.query.can_filter():
+            object_list = visible_to(object_list, request.user, perm)
+            restrict = False
+        field_list = []
+        model = getattr(object_list, 'model', None)
+        if model is None and object_list:
+            model = object_list[0].__class__
+        if model is not None:
+            field_list = table_fields(model, fields, exclude)
+            object_list = plan_related(object_list, field_list)
+        object_list = list(object_list or ())
+        if restrict and object_list:
+            # Pages are sliced querysets, which can't be filtered any more:
+            # the objects of the page are checked by pk instead.
+            pks = [o.pk for o in object_list]
+            allowed = set(visible_to(model._default_manager.filter(pk__in=pks), request.user, perm).values_list('pk', flat=True))
+            object_list = [o for o in object_list if o.pk in allowed]
+        table = DetailTableRendering(request, object_list, field_list)
+        url = './?' + ''.join(['%s=%s&' % (key, value) for key, value in request.GET.items() if key != "order_by"])
         try:
-            order_by = self.request.GET['order_by']
+            order_by = request.GET['order_by']
         except:
             order_by = []
-        output = u'<p class="disabled">%s</p>' % _('No results.')
-        if len(self.object_list) > 0:
-            instance = self.object_list[0]
-            meta = instance._meta
-            self.field_list = [f for f in meta.fields if is_visible(f.name, fields, exclude)]
-            output = u'<table class="%s-detail-table">\n' % instance.__class__.__name__.lower()
-            output += u'\t<tr>\n'
-            for f in self.field_list:
-                verbose_name = _(f.verbose_name)
-                verbose_name = verbose_name[0].capitalize() + verbose_name[1:]
-                field_type = f.__class__.__name__.lower().replace("field", "")
-                if f.choices:
-                    field_type += "_choices"
-                if f.name in order_by:
-                    verse = "-"
-                    aclass = "asc"
-                    if "-%s" % f.name in order_by:
-                        verse = ""
-                        aclass = "desc"
-                    output += u'\t\t<th class="%s"><a class="%s" href="%sorder_by=%s%s">%s</a></th>\n' % (field_type, aclass, url, verse, f.name, verbose_name)
-                else:
-                    output += u'\t\t<th class="%s"><a href="%sorder_by=%s">%s</a></th>\n' % (field_type, url, f.name, verbose_name)
-            if 'actions' not in exclude and self.actions_template(self.object_list[0]):
-                output += u'\t\t<th class="actions"></td>'
-            output += u'\t</tr>\n'
-            for i, instance in enumerate(self.object_list):
-                output += row_template(i)
-                for j, f in enumerate(self.field_list):
-                    output += self.column_template(instance, j)
-                if 'actions' not in exclude:
-                    output += self.actions_template(instance)                    
-                output += u'\t</tr>\n'
-            output += u'</table>\n'
-        return mark_safe(output)
+        if not table.object_list:
+            return mark_safe(u'<p class="disabled">%s</p>' % _('No results.'))
+
+        instance = table.object_list[0]
+        meta = instance._meta
+        if 'actions' not in exclude:
+            model_name = meta.model_name
+            table.object_perms = get_object_perms_for(request.user, table.object_list, ["change_%s" % model_name, "delete_%s" % model_name])
+        samples = (table.object_list[0], table.object_list[-1])
+        table.absolute_url = url_builder(instance.__class__, 'get_absolute_url', samples)
+        table.edit_url = url_builder(instance.__class__, 'get_edit_url', samples)
+        table.delete_url = url_builder(instance.__class__, 'get_delete_url', samples)
+        table.formatters = compile_columns(tuple(table.field_list), get_language())
+
+        output = [u'<table class="%s-detail-table">\n' % instance.__class__.__name__.lower(), u'\t<tr>\n']
+        for f in table.field_list:
+            verbose_name = _(f.verbose_name)
+            verbose_name = verbose_name[0].capitalize() + verbose_name[1:]
+            field_type = f.__class__.__name__.lower().replace("field", "")
+            if f.choices:
+                field_type += "_choices"
+            if f.many_to_many:
+                output.append(u'\t\t<th class="%s">%s</th>\n' % (field_type, verbose_name))
+            elif f.name in order_by:
+                verse = "-"
+                aclass = "asc"
+                if "-%s" % f.name in order_by:
+                    verse = ""
+                    aclass = "desc"
+                output.append(u'\t\t<th class="%s"><a class="%s" href="%sorder_by=%s%s">%s</a></th>\n' % (field_type, aclass, url, verse, f.name, verbose_name))
+            else:
+                output.append(u'\t\t<th class="%s"><a href="%sorder_by=%s">%s</a></th>\n' % (field_type, url, f.name, verbose_name))
+        actions = None
+        if 'actions' not in exclude:
+            actions = [self.actions_template(table, o) for o in table.object_list]
+            if any(actions):
+                output.append(u'\t\t<th class="actions"></th>')
+        output.append(u'\t</tr>\n')
+        for i, instance in enumerate(table.object_list):
+            output.append(row_template(i))
+            output.extend([self.column_template(table, instance, j) for j in range(len(table.formatters))])
+            if actions is not None:
+                output.append(actions[i])
+            output.append(u'\t</tr>\n')
+        output.append(u'</table>\n')
+        return mark_safe(u''.join(output))
     
     def render(self, context):
         args = []
@@ -188,35 +304,44 @@ class DetailTableNode(Node):
             except VariableDoesNotExist:
                 kwargs[k] = None
         
-        return self.render_with_args(context, *args, **kwargs)
+        if not settings.DEBUG:
+            return self.render_with_args(context, *args, **kwargs)
+
+        with QueryCounter() as counter:
+            output = self.render_with_args(context, *args, **kwargs)
+        logger.debug("detail_table rendered with %d queries", counter.count)
+        return mark_safe(u'%s<!-- detail_table: %d queries -->\n' % (output, counter.count))
         
-    def column_template(self, instance, index):
-        css = ''
-        value = field_to_value(self.field_list[index], instance)
-        if isinstance(value, (int, float)) and not isinstance(value, bool):
-            css = u' class="number"'
-        value = value_to_string(value)
-        if index == 0 and hasattr(instance, 'get_absolute_url'):
-            value = u'<a href="%s">%s</a>' % (instance.get_absolute_url(), value)
-        return u'\t\t<td%s>%s</td>\n' % (css, value)
-
-    def actions_template(self, instance):
+    def column_template(self, table, instance, index):
+        value, is_number = table.formatters[index](instance)
+        if index == 0 and table.absolute_url is not None:
+            value = u'<a href="%s">%s</a>' % (table.absolute_url(instance), value)
+        if is_number:
+            return u'\t\t<td class="number">%s</td>\n' % value
+        return u'\t\t<td>%s</td>\n' % value
+
+    def actions_template(self, table, instance):
         actions = []
-        ct = ContentType.objects.get_for_model(instance)
-        try:
-            actions.append(u'<span class="edit"><a title="%(label)s" href="%(link)s">%(label)s</a></span>' % {
-                "link": instance.get_edit_url(),
-                "label": _('Edit')
-            })
-        except AttributeError:
-            pass
-        try:
-            actions.append(u'<span class="delete"><a title="%(label)s" href="%(link)s">%(label)s</a></span>' % {
-                "link": instance.get_delete_url(),
-                "label": _('Delete')
-            })
-        except AttributeError:
-            pass
+        model_name = instance._meta.model_name
+        perms = None
+        if table.object_perms is not None:
+            perms = table.object_perms.get(instance.pk, ())
+        if table.edit_url is not None and (perms is None or "change_%s" % model_name in perms):
+            try:
+                actions.append(u'<span class="edit"><a title="%(label)s" href="%(link)s">%(label)s</a></span>' % {
+                    "link": table.edit_url(instance),
+                    "label": table.labels["edit"]
+                })
+            except AttributeError:
+                pass
+        if table.delete_url is not None and (perms is None or "delete_%s" % model_name in perms):
+            try:
+                actions.append(u'<span class="delete"><a title="%(label)s" href="%(link)s">%(label)s</a></span>' % {
+                    "link": table.delete_url(instance),
+                    "label": table.labels["delete"]
+                })
+            except AttributeError:
+                pass
         output = ' '.join(actions)
         if output:
             output = u'<td><span class="actions">%s</span></td>' % output
@@ -226,7 +351,12 @@ class DetailTableNode(Node):
 def detail_table(parser, token):
     """Renders an interactive table from an object list.
 
-    Example tag usage: {% detail_table object_list [fields] [exclude] %}
+    Example tag usage: {% detail_table object_list [fields] [exclude] [perm="view_x"] %}
+
+    If perm is given, only the objects on which the current user has perm
+    are shown; views should rather restrict their querysets before paginating
+    them, so that pages are full. Related objects of the shown fields are loaded along with
+    the list; with DEBUG on, the number of queries is left in a comment.
     """
     tag_name, args, kwargs = parse_args_kwargs(parser, token)
     return DetailTableNode(*args, **kwargs)
@@ -244,8 +374,9 @@ def form_error_template(index, form_or_instance):
         output += '</tr>\n'
     return output
 
-def get_object_field(name, fields, form_or_instance, attrs={}):
-    name, sep, suffix = name.partition(':')
+def get_object_field(name, fields, form_or_instance, attrs={}, suffix=None):
+    if suffix is None:
+        name, sep, suffix = name.partition(':')
 
     if name in fields:
         field = fields[name]
@@ -259,48 +390,119 @@ def get_object_field(name, fields, form_or_instance, attrs={}):
 
     return ''
 
+def _layout_entry(name):
+    name, sep, suffix = name.partition(':')
+    return name, suffix
+
+@lru_cache(maxsize=256)
+def parse_layout(layout):
+    """Parses a property_table layout, given as a string or as nested tuples.
+
+    Returns a tuple of rows. Each row is a (spans, entries) pair, where
+    entries are (name, suffix) pairs and spans is True for rows holding a
+    single field.
+    """
+    if isinstance(layout, str):
+        try:
+            layout = ast.literal_eval(layout)
+        except (ValueError, SyntaxError):
+            raise TemplateSyntaxError("Invalid property_table layout: %r" % layout)
+    if not isinstance(layout, (list, tuple)):
+        raise TemplateSyntaxError("Invalid property_table layout: %r" % (layout,))
+    rows = []
+    for item in layout:
+        if isinstance(item, str):
+            rows.append((True, (_layout_entry(item),)))
+        elif isinstance(item, (list, tuple)):
+            rows.append((False, tuple([_layout_entry(f) for f in item if isinstance(f, str)])))
+        else:
+            rows.append((False, ()))
+    return tuple(rows)
+
+def _hashable_layout(layout):
+    if isinstance(layout, list):
+        return tuple([_hashable_layout(item) for item in layout])
+    return layout
+
+@lru_cache(maxsize=256)
+def compile_model_layout(model, layout, language):
+    """Returns the layout of a property_table for objects of model, and the
+    many-to-many fields it shows.
+
+    Each entry of the parsed layout is resolved to the model field of that
+    name, its formatter and its translated label, or left to be looked up
+    as an attribute of the object. Without a layout, every field is shown
+    on its own row.
+    """
+    meta = model._meta
+    fields = dict([(f.name, f) for f in (meta.fields + meta.many_to_many)])
+    if layout is None:
+        rows = tuple([(True, ((name, ''),)) for name in fields])
+    else:
+        rows = parse_layout(layout)
+    compiled = []
+    for spans, entries in rows:
+        attrs = {'colspan': '3'} if spans else {}
+        cells = []
+        for name, suffix in entries:
+            field = fields.get(name)
+            if field is None:
+                cells.append((name, suffix, attrs, None, None, None))
+                continue
+            label = u'%s' % field.verbose_name
+            if not label:
+                continue
+            head = "\t\t<th>%s</th>\n\t\t<td%s>\n\t\t\t" % (label[0].capitalize() + label[1:], flatatt(attrs))
+            tail = "%s\n\t\t</td>\n" % suffix
+            cells.append((name, suffix, attrs, value_formatter(field), head, tail))
+        compiled.append(tuple(cells))
+    many_to_many = tuple([f for f in meta.many_to_many if f.name in [c[0] for cells in compiled for c in cells]])
+    return tuple(compiled), many_to_many
+
 class PropertyTableNode(Node):
     def __init__(self, *args, **kwargs):
         self.args = [Variable(arg) for arg in args]
         self.kwargs = dict([(k, Variable(arg)) for k, arg in kwargs.items()])
 
     def render_with_args(self, context, form_or_instance, layout=None, *args, **kwargs):
-        output = ""
-
-        if isinstance(form_or_instance, (models.Model, forms.ModelForm)):
-            fields = {}
-            output = ''
-            
-            if isinstance(form_or_instance, models.Model):
-                fields = dict([(f.name, f) for f in (form_or_instance._meta.fields + form_or_instance._meta.many_to_many)])
-            else:
-                fields = form_or_instance.fields
-
+        if not isinstance(form_or_instance, (models.Model, forms.ModelForm)):
+            return ""
+
+        layout = _hashable_layout(layout)
+        if layout is not None and not isinstance(layout, (str, tuple)):
+            return ""
+
+        output = []
+        if isinstance(form_or_instance, models.Model):
+            rows, many_to_many = compile_model_layout(form_or_instance.__class__, layout, get_language())
+            prefetched = getattr(form_or_instance, '_prefetched_objects_cache', {})
+            if [f for f in many_to_many if f.name not in prefetched]:
+                plan_related([form_or_instance], many_to_many)
+            for i, cells in enumerate(rows):
+                output.append(row_template(i))
+                for name, suffix, attrs, formatter, head, tail in cells:
+                    if formatter is None:
+                        output.append(get_object_field(name, {}, form_or_instance, attrs, suffix))
+                        continue
+                    value = formatter(form_or_instance)[0]
+                    if value:
+                        output.append(u'%s%s%s' % (head, value, tail))
+                output.append('\t</tr>\n')
+        else:
+            fields = form_or_instance.fields
             if layout is None:
-                layout = [n for n, f in fields.items()]
-            elif isinstance(layout, basestring):
-                layout = eval(layout)
+                rows = tuple([(True, ((name, ''),)) for name in fields])
             else:
-                return ""
-
-            for i, field in enumerate(layout):
-                output += form_error_template(i, form_or_instance)
-
-                output += row_template(i)
-
-                # Single field.
-                if isinstance(field, basestring):
-                    output += get_object_field(field, fields, form_or_instance, {'colspan': '3'})
-
-                # Many fields on the same row.
-                elif isinstance(field, list):
-                    for i, f in enumerate(field):
-                        if isinstance(f, basestring):
-                            output += get_object_field(f, fields, form_or_instance)
-
-                output += '\t</tr>\n'
-
-        return mark_safe(output)
+                rows = parse_layout(layout)
+            for i, (spans, entries) in enumerate(rows):
+                output.append(form_error_template(i, form_or_instance))
+                output.append(row_template(i))
+                attrs = {'colspan': '3'} if spans else {}
+                for name, suffix in entries:
+                    output.append(get_object_field(name, fields, form_or_instance, attrs, suffix))
+                output.append('\t</tr>\n')
+
+        return mark_safe(u''.join(output))
     
     def render(self, context):
         args = []
@@ -323,7 +525,9 @@ class PropertyTableNode(Node):
 def property_table(parser, token):
     """Renders a property table from a ModelForm or an object instance.
 
-    Example tag usage: {% property_table form [field1, [field2, field3], field4] %}
+    Example tag usage: {% property_table form "['field1', ['field2', 'field3'], 'field4']" %}
+
+    Layouts are parsed once and cached per model and layout.
     """
     tag_name, args, kwargs = parse_args_kwargs(parser, token)
     return PropertyTableNode(*args, **kwargs)
@@ -21,10 +21,12 @@ __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
 from django import template
+from django.db.models import QuerySet
 from django.template import Node, NodeList, Variable, Library
 from django.template import TemplateSyntaxError, VariableDoesNotExist
 
 from core.templatetags import parse_args_kwargs
+from core.utils.paginator import KeysetPaginator
 
 register = template.Library()
 
@@ -73,6 +75,19 @@ def objects_from(parser, token):
 
     return ObjectsFromNode(*args, **kwargs)
 
+def _navigator(obj_list):
+    """Returns a KeysetPaginator to look up neighbors in obj_list, or None.
+
+    Querysets ordered on nullable columns, or which can't be filtered, are
+    navigated in memory.
+    """
+    if isinstance(obj_list, QuerySet) and obj_list.query.can_filter():
+        try:
+            return KeysetPaginator(obj_list, 1)
+        except ValueError:
+            pass
+    return None
+
 @register.filter
 def index_of(obj_list, obj):
     """
@@ -80,16 +95,25 @@ def index_of(obj_list, obj):
 
     Example tag usage: {% object_list|index_of:object %}
     """
+    navigator = _navigator(obj_list)
+    if navigator is not None:
+        return navigator.position(obj)
     return list(obj_list).index(obj)+1
 
 @register.filter
 def first_object(obj_list):
     """
-    Returns the first object in an object list.
+    Returns the first object in an object list, or None.
 
     Example tag usage: {% object_list|first_object %}
     """
-    return obj_list[0]
+    navigator = _navigator(obj_list)
+    if navigator is not None:
+        return navigator.first()
+    try:
+        return obj_list[0]
+    except IndexError:
+        return None
 
 @register.filter
 def prev_object(obj_list, obj):
@@ -98,6 +122,9 @@ def prev_object(obj_list, obj):
 
     Example tag usage: {% object_list|prev_object:object %}
     """
+    navigator = _navigator(obj_list)
+    if navigator is not None:
+        return navigator.neighbor(obj, backward=True) or obj
     index = index_of(obj_list, obj)
     if index > 1:
         return obj_list[index-2]
@@ -110,8 +137,11 @@ def next_object(obj_list, obj):
 
     Example tag usage: {% object_list|next_object:object %}
     """
+    navigator = _navigator(obj_list)
+    if navigator is not None:
+        return navigator.neighbor(obj) or obj
     index = index_of(obj_list, obj)
-    if index < obj_list.count():
+    if index < len(obj_list):
         return obj_list[index]
     return obj
 
@@ -122,4 +152,7 @@ def last_object(obj_list):
 
     Example tag usage: {% object_list|last_object %}
     """
+    navigator = _navigator(obj_list)
+    if navigator is not None:
+        return navigator.last()
     return list(obj_list)[-1]
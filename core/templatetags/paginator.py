@@ -20,28 +20,23 @@ __author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
 __copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
 __version__ = '0.0.5'
 
-from django.core.paginator import Paginator
 from django import template
 
+from core.utils.paginator import paginate_request
+
 register = template.Library()
 
 @register.simple_tag(takes_context=True)
-def paginate(context, object_list, paginate_by=10):
+def paginate(context, object_list, paginate_by=10, keyset=False, approximate=False):
     """Allows pagination on arbitrary querysets.
+
+    Example tag usage: {% paginate object_list 10 keyset=True %}
+
+    With keyset, querysets are paginated by cursor on their ordering plus pk
+    instead of by page number. With approximate, large querysets aren't
+    counted exactly (see core.utils.paginator.approximate_count).
     """
-    request = context['request']
-
-    paginator = Paginator(object_list, paginate_by)
-
-    try:
-        page = int(request.GET.get('page', '1'))
-    except ValueError:
-        page = 1
-    
-    try:
-        p = paginator.page(page)
-    except:
-        p = paginator.page(paginator.num_pages)
+    paginator, p = paginate_request(context['request'], object_list, paginate_by, keyset, approximate)
 
     context['paginator'] = paginator
     context['page_obj'] = p
@@ -22,3 +22,5 @@ __version__ = '0.0.5'
 
 from .core.widgets.tests import *
 from .core.auth.tests import *
+from core.utils.tests import *
+from core.notifications.tests import *
@@ -4,9 +4,9 @@ ___ utils
 """
     
     
-from django.db import models
-from django.db.models import Q, query
-from django.db.models import fields as django_fields
+from django.db import models, connections
+from django.db.models import query, prefetch_related_objects
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
 from collections import OrderedDict
 from django.utils.encoding import force_str
 from django.utils.safestring import mark_safe
@@ -15,6 +15,8 @@ from django.utils.formats import localize
 from django.template.defaultfilters import date, time, striptags, truncatewords
 from django.conf import settings
 
+from .filters import field_filter
+
 class DependencyError(Exception):
     def __init__(self, app_name):
         self._app_name = app_name
@@ -85,12 +87,81 @@ def field_to_string(field, instance):
 def is_visible(field_name, fields=[], exclude=[]):
     return (len(fields) == 0 or field_name in fields) and field_name not in exclude
 
+def table_fields(model, fields=[], exclude=[]):
+    """Returns the fields of model shown in a table.
+
+    Many-to-many fields are shown only when explicitly listed in fields.
+    """
+    meta = model._meta
+    return [f for f in meta.fields if is_visible(f.name, fields, exclude)] \
+         + [f for f in meta.many_to_many if f.name in fields and f.name not in exclude]
+
+def related_lookups(fields):
+    """Returns the select_related and prefetch_related lookups needed to
+    render the given model fields.
+    """
+    selected, prefetched = [], []
+    for f in fields:
+        if f.many_to_many:
+            prefetched.append(f.name)
+        elif f.many_to_one or f.one_to_one:
+            selected.append(f.name)
+    return selected, prefetched
+
+def plan_related(object_list, fields):
+    """Loads the relations of the given fields along with object_list.
+
+    Unevaluated querysets get select_related() for foreign keys and
+    prefetch_related() for many-to-many fields; lists and evaluated
+    querysets are prefetched in place. Returns the object list to use.
+    """
+    selected, prefetched = related_lookups(fields)
+    if not selected and not prefetched:
+        return object_list
+    if isinstance(object_list, query.QuerySet) and object_list._result_cache is None:
+        if object_list._fields is not None:
+            return object_list
+        already = object_list.query.select_related
+        if already is not True:
+            selected = [n for n in selected if not (already and n in already)]
+            if selected:
+                object_list = object_list.select_related(*selected)
+        prefetched = [n for n in prefetched if n not in object_list._prefetch_related_lookups]
+        if prefetched:
+            object_list = object_list.prefetch_related(*prefetched)
+        return object_list
+    instances = [o for o in object_list if isinstance(o, models.Model)]
+    if instances:
+        prefetch_related_objects(instances, *(selected + prefetched))
+    return object_list
+
+class QueryCounter(object):
+    """Counts the queries run on a database connection inside a with block.
+    """
+    def __init__(self, using='default'):
+        self.using = using
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connections[self.using].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
 def filter_field_value(request, field):
     name = field.name
-    if f"sub_{name}" in request.POST:
+    if f"sub_{name}" in request.POST or f"sub_{field.attname}" in request.POST:
         return None
     elif name in request.POST:
         return request.POST[name]
+    elif field.attname in request.POST:
+        return request.POST[field.attname]
     elif 'filter_field' in request.POST and request.POST['filter_field'] == name:
         return request.POST['filter_query']
     return None
@@ -112,7 +183,11 @@ def filter_objects(request, model_or_queryset=None, fields=[], exclude=[]):
         object_list = model.objects.all()
 
     if not object_list.query.can_filter():
-        pks = [instance.pk for instance in object_list]
+        if object_list.query.is_sliced:
+            # MySQL does not support LIMIT in IN subqueries.
+            pks = list(object_list.values_list('pk', flat=True))
+        else:
+            pks = object_list.values('pk')
         object_list = model.objects.filter(pk__in=pks)
     
     filter_fields = get_filter_fields(request, model, fields, exclude)
@@ -121,10 +196,9 @@ def filter_objects(request, model_or_queryset=None, fields=[], exclude=[]):
         queryset = []
         for f, value in filter_fields:
             if value is not None:
-                if isinstance(f, django_fields.related.RelatedField):
-                    pass  # Fail silently.
-                else:
-                    queryset.append(Q(**{f"{f.name}__startswith": value}) | Q(**{f"{f.name}__endswith": value}))
+                q = field_filter(f, value)
+                if q is not None:
+                    queryset.append(q)
 
     if queryset:
         matches = object_list.filter(*queryset)
@@ -154,3 +228,102 @@ def assign_code(instance, queryset=None, code_field_name='code', order_field_nam
         except queryset.model.DoesNotExist:
             pass
         setattr(instance, code_field_name, f'{uid}-{year}')
+
+class LazyRelationDescriptor(object):
+    """Wraps the descriptor of a nullable relation to fill it on first access.
+
+    When the relation of a saved object is empty, "provider" is called with
+    the object's class and the object itself and is expected to set it.
+    """
+    def __init__(self, descriptor, provider):
+        self.descriptor = descriptor
+        self.provider = provider
+
+    def __getattr__(self, name):
+        return getattr(self.descriptor, name)
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = self.descriptor.__get__(instance, cls)
+        flag = "_providing_%s" % self.descriptor.field.name
+        if value is None and instance.pk is not None and not instance.__dict__.get(flag, False):
+            instance.__dict__[flag] = True
+            try:
+                self.provider(instance.__class__, instance)
+            finally:
+                del instance.__dict__[flag]
+            value = self.descriptor.__get__(instance, cls)
+        return value
+
+    def __set__(self, instance, value):
+        self.descriptor.__set__(instance, value)
+
+def provide_lazily(cls, field_name, provider):
+    """Makes the given relation of cls be filled by "provider" on first access.
+    """
+    descriptor = getattr(cls, field_name, None)
+    if isinstance(descriptor, ForwardManyToOneDescriptor):
+        setattr(cls, field_name, LazyRelationDescriptor(descriptor, provider))
+
+def peek_relation(instance, field_name):
+    """Returns the current value of the given relation without filling it.
+    """
+    descriptor = getattr(instance.__class__, field_name, None)
+    if isinstance(descriptor, LazyRelationDescriptor):
+        return descriptor.descriptor.__get__(instance, instance.__class__)
+    return getattr(instance, field_name)
+
+def save_relation(instance, field_name):
+    """Stores the given relation of instance without a full save().
+
+    No signal is sent. Objects without a default manager are simply saved.
+    """
+    cls = instance.__class__
+    if hasattr(cls, '_default_manager'):
+        cls._default_manager.filter(pk=instance.pk).update(**{field_name: getattr(instance, field_name)})
+    else:
+        instance.save()
+
+def bulk_provide(model, field_name, slug_format, defaults={}, clear=None, on_batch=None, batch_size=1000):
+    """Fills the given relation for all the objects of model missing it.
+
+    Related objects are identified by a slug built from slug_format, the
+    lowercase model name and the object's pk. Existing related objects are
+    reused, after passing them to "clear" if given. Missing ones are created
+    with "defaults". Objects are processed in batches of batch_size, with a
+    fixed number of queries per batch, and each updated batch is passed to
+    "on_batch" if given.
+
+    Returns the number of updated objects.
+    """
+    related_model = model._meta.get_field(field_name).related_model
+    manager = model._default_manager
+    prefix = model.__name__.lower()
+    missing = manager.filter(**{"%s__isnull" % field_name: True}).only('pk').order_by('pk')
+    count = 0
+    last_pk = None
+
+    while True:
+        batch = missing if last_pk is None else missing.filter(pk__gt=last_pk)
+        objs = list(batch[:batch_size])
+        if not objs:
+            break
+        last_pk = objs[-1].pk
+
+        slugs = dict([(obj.pk, slug_format % (prefix, obj.pk)) for obj in objs])
+        related = related_model._default_manager.in_bulk(list(slugs.values()), field_name='slug')
+        if related and callable(clear):
+            clear(list(related.values()))
+        new_related = [related_model(slug=slug, **defaults) for slug in slugs.values() if slug not in related]
+        for r in related_model._default_manager.bulk_create(new_related):
+            related[r.slug] = r
+
+        for obj in objs:
+            setattr(obj, field_name, related[slugs[obj.pk]])
+        manager.bulk_update(objs, [field_name])
+        if callable(on_batch):
+            on_batch(objs)
+        count += len(objs)
+
+    return count
@@ -0,0 +1,199 @@
+"""
+___ utils.exports
+    streaming CSV/XLSX exports of querysets
+"""
+
+import csv
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db import models
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+from django.utils.translation import gettext as _
+from django.conf import settings
+
+from core.utils import field_to_value, plan_related, table_fields
+
+# Number of rows fetched from the database at a time.
+DEFAULT_EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# Leading characters which make spreadsheets read a CSV cell as a formula.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_EXPORT_CHUNK_SIZE)
+
+def plain_value(value):
+    """Returns value, as given by field_to_value, as a cell value.
+
+    Numbers are kept as they are, so that spreadsheets can use them.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return _('Yes') if value else _('No')
+    if isinstance(value, (int, float, Decimal)):
+        return value
+    return str(value)
+
+def export_formatter(field):
+    """Returns a function giving the exported value of field for an instance.
+
+    Relations and links are exported as plain text rather than markup.
+    """
+    if field.many_to_many:
+        return lambda instance: ', '.join([str(item) for item in getattr(instance, field.name).all()])
+    if field.is_relation:
+        def related(instance):
+            value = getattr(instance, field.name)
+            return '' if value is None else str(value)
+        return related
+    if isinstance(field, (models.URLField, models.EmailField)):
+        return lambda instance: getattr(instance, field.attname) or ''
+    return lambda instance: plain_value(field_to_value(field, instance))
+
+def export_rows(queryset, fields, chunk_size=None):
+    """Yields the header and then one row per object of queryset.
+
+    Objects are fetched chunk_size at a time, with their related objects.
+    """
+    formatters = [export_formatter(f) for f in fields]
+    yield [str(f.verbose_name)[:1].upper() + str(f.verbose_name)[1:] for f in fields]
+    queryset = plan_related(queryset, fields)
+    for instance in queryset.iterator(chunk_size=chunk_size or get_chunk_size()):
+        yield [format(instance) for format in formatters]
+
+class Echo(object):
+    """A file-like object returning what is written to it.
+    """
+    def write(self, value):
+        return value
+
+def csv_value(value):
+    """Returns value as a CSV cell.
+
+    Text which a spreadsheet would run as a formula is prefixed with a
+    quote, so that it's shown as it is.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def csv_stream(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow([csv_value(v) for v in row])
+
+class ZipBuffer(object):
+    """An unseekable file-like object collecting what zipfile writes to it.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+XLSX_PARTS = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="%s" sheetId="1" r:id="rId1"/></sheets>'
+     '</workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+     '</Relationships>'),
+)
+
+# Characters XML 1.0 doesn't allow, and those not allowed in sheet names.
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+def xlsx_cell(value):
+    """Returns value as a cell: a number, or else an inline string.
+
+    Text is never written as a formula, so it doesn't need escaping like
+    in CSV files.
+    """
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return '<c><v>%s</v></c>' % value
+    return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % escape(INVALID_XML_CHARS.sub('', str(value)))
+
+def xlsx_stream(rows, title='Sheet1'):
+    """Yields an XLSX workbook with one sheet holding rows, piece by piece.
+
+    Cells are written as inline strings or numbers, so no shared string
+    table has to be kept in memory.
+    """
+    title = INVALID_SHEET_CHARS.sub('', INVALID_XML_CHARS.sub('', title))[:31] or 'Sheet1'
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS:
+            if name == 'xl/workbook.xml':
+                content = content % escape(title, {'"': '&quot;'})
+            archive.writestr(name, content)
+        yield buffer.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for row in rows:
+                sheet.write(('<row>%s</row>' % ''.join([xlsx_cell(v) for v in row])).encode('utf-8'))
+                data = buffer.drain()
+                if data:
+                    yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+def export_response(queryset, format='csv', fields=[], exclude=[], filename=None):
+    """Returns a streaming response exporting queryset in the given format.
+
+    Columns are the fields a detail table would show, formatted like
+    field_to_value but without markup.
+    """
+    model = queryset.model
+    rows = export_rows(queryset, table_fields(model, fields, exclude))
+    filename = filename or slugify(str(model._meta.verbose_name_plural)) or model._meta.model_name
+    if format == 'xlsx':
+        response = StreamingHttpResponse(
+            xlsx_stream(rows, str(model._meta.verbose_name_plural).capitalize()),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    else:
+        format = 'csv'
+        response = StreamingHttpResponse(csv_stream(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, format)
+    return response
@@ -0,0 +1,217 @@
+"""
+___ utils.filters
+    typed filters for filter_objects
+"""
+
+import re
+from datetime import date, datetime, time, timedelta
+
+from django import forms
+from django.db import models
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from django.conf import settings
+
+# Lookup used by the "contains" mode of text filters ("~value"). With
+# django.contrib.postgres it can be "trigram_similar" or "search".
+DEFAULT_FILTER_CONTAINS_LOOKUP = 'icontains'
+
+RANGE_SEPARATOR = '..'
+
+_comparison = re.compile(r'^(>=|<=|>|<)\s*(.+)$')
+_year = re.compile(r'^\d{4}$')
+_month = re.compile(r'^(\d{4})-(\d{1,2})$')
+
+_comparison_lookups = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}
+
+def get_contains_lookup():
+    return getattr(settings, 'FILTER_CONTAINS_LOOKUP', DEFAULT_FILTER_CONTAINS_LOOKUP)
+
+def filter_kind(field):
+    """Returns the kind of filter used for the given field, or None.
+
+    Kinds are "related", "choice", "boolean", "datetime", "date", "time",
+    "number" and "text".
+    """
+    if isinstance(field, (models.ForeignKey, models.OneToOneField)):
+        return 'related'
+    if field.is_relation:
+        return None
+    if field.choices:
+        return 'choice'
+    if isinstance(field, models.BooleanField):
+        return 'boolean'
+    if isinstance(field, models.DateTimeField):
+        return 'datetime'
+    if isinstance(field, models.DateField):
+        return 'date'
+    if isinstance(field, models.TimeField):
+        return 'time'
+    if isinstance(field, (models.IntegerField, models.FloatField, models.DecimalField, models.AutoField)):
+        return 'number'
+    if isinstance(field, (models.CharField, models.TextField)):
+        return 'text'
+    return None
+
+def _no_match():
+    return Q(pk__in=[])
+
+def _range(name, value, convert):
+    """Builds exact, comparison ("<x", ">=x") or range ("a..b") lookups.
+    """
+    m = _comparison.match(value)
+    if m:
+        op, value = m.groups()
+        return Q(**{"%s__%s" % (name, _comparison_lookups[op]): convert(value.strip())})
+    if RANGE_SEPARATOR in value:
+        low, high = [v.strip() for v in value.split(RANGE_SEPARATOR, 1)]
+        q = Q()
+        if low:
+            q &= Q(**{"%s__gte" % name: convert(low)})
+        if high:
+            q &= Q(**{"%s__lte" % name: convert(high)})
+        return q
+    return Q(**{name: convert(value)})
+
+def _day_bounds(field, value):
+    """Returns the [start, end) bounds of the period described by value.
+
+    Value is a year ("2012"), a month ("2012-05") or a date in any of the
+    accepted input formats.
+    """
+    if _year.match(value):
+        start = date(int(value), 1, 1)
+        end = date(start.year + 1, 1, 1)
+    elif _month.match(value):
+        year, month = [int(v) for v in _month.match(value).groups()]
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
+    else:
+        start = forms.DateField().clean(value)
+        end = start + timedelta(days=1)
+    if isinstance(field, models.DateTimeField):
+        start, end = datetime.combine(start, time.min), datetime.combine(end, time.min)
+        if settings.USE_TZ:
+            start, end = timezone.make_aware(start), timezone.make_aware(end)
+    return start, end
+
+def _date_filter(field, value):
+    name = field.name
+    m = _comparison.match(value)
+    if m:
+        op, value = m.groups()
+        start, end = _day_bounds(field, value.strip())
+        bound = start if op in ('>=', '<') else end
+        lookup = {'>': 'gte', '>=': 'gte', '<': 'lt', '<=': 'lt'}[op]
+        return Q(**{"%s__%s" % (name, lookup): bound})
+    if RANGE_SEPARATOR in value:
+        low, high = [v.strip() for v in value.split(RANGE_SEPARATOR, 1)]
+        q = Q()
+        if low:
+            q &= Q(**{"%s__gte" % name: _day_bounds(field, low)[0]})
+        if high:
+            q &= Q(**{"%s__lt" % name: _day_bounds(field, high)[1]})
+        return q
+    start, end = _day_bounds(field, value)
+    return Q(**{"%s__gte" % name: start, "%s__lt" % name: end})
+
+def _boolean(value):
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes', 'y', str(_('Yes')).lower()):
+        return True
+    if value in ('0', 'false', 'no', 'n', str(_('No')).lower()):
+        return False
+    raise ValidationError("Invalid boolean value")
+
+def field_filter(field, value):
+    """Returns the Q object filtering field on the value typed by the user.
+
+    Lookups are chosen by field type so that they can use plain B-tree
+    indexes:
+
+     * text: prefix match; "=value" for an exact match and "~value" for
+       the (unindexed, unless trigram/full-text backed) contains mode
+     * numbers, times: exact, "<x", ">=x" or "a..b" ranges
+     * dates: a day, a month ("2012-05") or a year ("2012"), as ranges,
+       with the same comparisons
+     * choices: the value or (part of) its label
+     * foreign keys: one or more comma-separated ids
+
+    Returns None for fields which can't be filtered and a condition matching
+    nothing for values which aren't valid for the field.
+    """
+    kind = filter_kind(field)
+    value = value.strip()
+    if kind is None:
+        return None
+    if not value:
+        return Q()
+
+    name = field.name
+    try:
+        if kind == 'text':
+            if value.startswith('='):
+                return Q(**{name: value[1:]})
+            if value.startswith('~'):
+                return Q(**{"%s__%s" % (name, get_contains_lookup()): value[1:]})
+            return Q(**{"%s__startswith" % name: value})
+
+        if kind == 'related':
+            target = field.target_field
+            ids = [target.to_python(v.strip()) for v in value.split(',') if v.strip()]
+            return Q(**{"%s__in" % field.attname: ids})
+
+        if kind == 'choice':
+            keys = [k for k, label in field.flatchoices if str(k) == value]
+            if not keys:
+                keys = [k for k, label in field.flatchoices if value.lower() in str(label).lower()]
+            return Q(**{"%s__in" % name: keys}) if keys else _no_match()
+
+        if kind == 'boolean':
+            return Q(**{name: _boolean(value)})
+
+        if kind in ('date', 'datetime'):
+            return _date_filter(field, value)
+
+        if kind == 'time':
+            return _range(name, value, forms.TimeField().clean)
+
+        return _range(name, value, field.to_python)
+
+    except (ValidationError, ValueError, TypeError):
+        return _no_match()
+
+def index_hint(field):
+    """Returns the kind of index which serves the filters of the given field.
+
+    Returns "btree", "btree_pattern" (prefix matches), "trigram" (contains
+    mode backed by pg_trgm) or None (booleans aren't selective enough).
+    """
+    kind = filter_kind(field)
+    if kind in (None, 'boolean'):
+        return None
+    if kind == 'text':
+        if get_contains_lookup() == 'trigram_similar':
+            return 'trigram'
+        return 'btree_pattern'
+    return 'btree'
+
+def has_index(field):
+    """Tells whether the given field is the leading column of an index.
+    """
+    if field.primary_key or field.unique or field.db_index:
+        return True
+    meta = field.model._meta
+    for index in meta.indexes:
+        if index.fields and index.fields[0].lstrip('-') == field.name:
+            return True
+    for fields in list(meta.unique_together) + list(getattr(meta, 'index_together', ())):
+        if fields and fields[0] == field.name:
+            return True
+    for constraint in meta.constraints:
+        fields = getattr(constraint, 'fields', ())
+        if fields and fields[0] == field.name:
+            return True
+    return False
@@ -0,0 +1,98 @@
+"""
+___ utils.formatters
+    precompiled cell formatters for tables
+"""
+
+from django.db import models
+from django.conf import settings
+from django.template.defaultfilters import date, time
+from django.utils.translation import gettext as _
+
+from core.utils import field_to_value, value_to_string
+
+def value_formatter(field):
+    """Returns a function rendering field for an instance, like field_to_string.
+
+    The function returns the rendered string and whether the value is a
+    number. The type checks of field_to_value and value_to_string are done
+    once, here, and translated strings are resolved in the active language.
+    """
+    name = field.attname if not field.is_relation else field.name
+    empty = u"<span class='disabled'>%s</span>" % _('empty')
+
+    def generic(instance):
+        value = field_to_value(field, instance)
+        return value_to_string(value), isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    if field.primary_key and not field.is_relation:
+        def key(instance):
+            value = getattr(instance, name)
+            if not value:
+                return empty, False
+            return u'#%s' % value, False
+        return key
+
+    if field.is_relation or field.choices:
+        return generic
+
+    if isinstance(field, (models.SlugField, models.PositiveIntegerField)):
+        return generic
+
+    if isinstance(field, models.URLField) or isinstance(field, models.EmailField):
+        link = u'<a href="%s">%s</a>' if isinstance(field, models.URLField) else u'<a href="mailto:%s">%s</a>'
+        def url(instance):
+            value = getattr(instance, name)
+            if not value:
+                return empty, False
+            return link % (value, value), False
+        return url
+
+    if isinstance(field, (models.CharField, models.TextField)):
+        def text(instance):
+            value = getattr(instance, name)
+            if value is None or value == '':
+                return empty, False
+            if not isinstance(value, str):
+                return generic(instance)
+            return value, False
+        return text
+
+    if isinstance(field, models.BooleanField):
+        yes = u"<span class='yes'>%s</span>" % _('Yes')
+        no = u"<span class='no'>%s</span>" % _('No')
+        def boolean(instance):
+            return (yes if getattr(instance, name) else no), False
+        return boolean
+
+    if isinstance(field, models.IntegerField):
+        def integer(instance):
+            value = getattr(instance, name)
+            if value is None:
+                return empty, False
+            if type(value) is not int:
+                return generic(instance)
+            return u'%d' % value, True
+        return integer
+
+    if isinstance(field, models.FloatField):
+        def number(instance):
+            value = getattr(instance, name)
+            if value is None:
+                return empty, False
+            if type(value) is not float:
+                return generic(instance)
+            return u'%.2f' % value, True
+        return number
+
+    if isinstance(field, (models.DateTimeField, models.DateField, models.TimeField)):
+        if isinstance(field, models.DateTimeField):
+            render, format = date, settings.DATETIME_FORMAT
+        elif isinstance(field, models.DateField):
+            render, format = date, settings.DATE_FORMAT
+        else:
+            render, format = time, settings.TIME_FORMAT
+        def when(instance):
+            return (render(getattr(instance, name), format) or empty), False
+        return when
+
+    return generic
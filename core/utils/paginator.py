@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import json
+import hashlib
+from datetime import date, time
+from decimal import Decimal
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator, Page, InvalidPage, EmptyPage, PageNotAnInteger
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from django.conf import settings
+
+CURSOR_SALT = "core.utils.paginator"
+
+# Below this estimated number of rows, approximate counts are exact.
+DEFAULT_PAGINATOR_EXACT_COUNT_LIMIT = 10000
+
+# How long counts without a planner estimate are cached, in seconds.
+DEFAULT_PAGINATOR_COUNT_CACHE_TIMEOUT = 300
+
+class InvalidCursor(InvalidPage):
+    pass
+
+class KeysetPage(object):
+    """A page of objects returned by a KeysetPaginator.
+    """
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of %d objects>' % len(self)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.cursor_for(self.object_list[-1], 'next')
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.cursor_for(self.object_list[0], 'previous')
+        return None
+
+class KeysetPaginator(object):
+    """Paginates a queryset on its ordering columns instead of using offsets.
+
+    The primary key is always appended to the ordering, so that every row
+    has a unique position. Pages are addressed by opaque cursors pointing
+    to the first or last row of the adjacent page, so fetching a deep page
+    costs the same as fetching the first one. Ordering columns must not be
+    nullable nor relations, and expressions or random orderings can't be
+    used: such querysets raise ValueError.
+    """
+    keyset = True
+
+    def __init__(self, queryset, per_page=10, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        for o in ordering:
+            if not isinstance(o, str):
+                raise ValueError("Can't paginate on the expression %r." % (o,))
+            if o == '?':
+                raise ValueError("Can't paginate on a random ordering.")
+        pk_name = queryset.model._meta.pk.name
+        if not [o for o in ordering if o.lstrip('-') in ('pk', pk_name)]:
+            desc = ordering and ordering[-1].startswith('-')
+            ordering.append('-pk' if desc else 'pk')
+        self.keys = [(o.lstrip('-'), o.startswith('-')) for o in ordering]
+        for name, desc in self.keys:
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.null:
+                raise ValueError("Can't paginate on the nullable field '%s'." % name)
+            if field.is_relation:
+                raise ValueError("Can't paginate on the relation '%s'." % name)
+
+    def page(self, cursor=None):
+        """Returns the page which follows (or precedes) the given cursor.
+
+        Without a cursor, the first page is returned.
+        """
+        values, direction = self.decode(cursor) if cursor else (None, 'next')
+        backward = (direction == 'previous')
+
+        queryset = self._ordered(backward)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backward))
+
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if backward:
+            object_list.reverse()
+            return KeysetPage(self, object_list, True, has_more)
+        return KeysetPage(self, object_list, has_more, values is not None)
+
+    def cursor_for(self, obj, direction='next'):
+        """Returns the cursor of the page adjacent to the given object.
+        """
+        values = []
+        for value in self.key_values(obj):
+            if isinstance(value, (date, time)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        return signing.dumps([direction[0], values], salt=CURSOR_SALT, compress=True)
+
+    def key_values(self, obj):
+        """Returns the values of the ordering columns for the given object.
+        """
+        values = []
+        for name, desc in self.keys:
+            value = obj
+            for attr in name.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def first(self):
+        """Returns the first object, or None.
+        """
+        return self._ordered().first()
+
+    def last(self):
+        """Returns the last object, or None.
+        """
+        return self._ordered(True).first()
+
+    def neighbor(self, obj, backward=False):
+        """Returns the object which follows (or precedes) obj, or None.
+
+        This is a single LIMIT 1 query on the ordering columns.
+        """
+        return self._ordered(backward).filter(self._seek(self.key_values(obj), backward)).first()
+
+    def position(self, obj):
+        """Returns the 1-based position of obj, counting the preceding objects.
+        """
+        return self.queryset.filter(self._seek(self.key_values(obj), True)).count() + 1
+
+    def decode(self, cursor):
+        """Returns the key values and the direction stored in the given cursor.
+        """
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        if len(values) != len(self.keys) or direction not in ('n', 'p'):
+            raise InvalidCursor('Invalid cursor')
+        return values, ('previous' if direction == 'p' else 'next')
+
+    def _ordered(self, backward=False):
+        return self.queryset.order_by(*[('-' if desc != backward else '') + name for name, desc in self.keys])
+
+    def _seek(self, values, backward):
+        """Returns the condition matching the rows after the given key values.
+        """
+        condition = Q()
+        equal = {}
+        for (name, desc), value in zip(self.keys, values):
+            lookup = '%s__%s' % (name, 'lt' if desc != backward else 'gt')
+            condition |= Q(**dict(equal, **{lookup: value}))
+            equal[name] = value
+        return condition
+
+def estimated_count(queryset):
+    """Returns the number of rows of queryset estimated by the query planner.
+
+    Returns None if the database doesn't give estimates.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def approximate_count(queryset):
+    """Returns an approximate number of objects of queryset, and whether it
+    is exact.
+
+    Large querysets are counted by the query planner, small ones exactly.
+    Without planner estimates, exact counts are cached for a while.
+    """
+    estimate = estimated_count(queryset)
+    if estimate is not None:
+        if estimate >= getattr(settings, 'PAGINATOR_EXACT_COUNT_LIMIT', DEFAULT_PAGINATOR_EXACT_COUNT_LIMIT):
+            return estimate, False
+        return queryset.count(), True
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = "core.utils.paginator.count.%s" % hashlib.md5(repr((queryset.db, sql, params)).encode('utf-8')).hexdigest()
+    count = cache.get(key)
+    if count is not None:
+        return count, False
+    count = queryset.count()
+    cache.set(key, count, getattr(settings, 'PAGINATOR_COUNT_CACHE_TIMEOUT', DEFAULT_PAGINATOR_COUNT_CACHE_TIMEOUT))
+    return count, True
+
+class ApproximatePage(Page):
+    """A page of an ApproximatePaginator.
+
+    When the count isn't exact, whether there is a next page is known from
+    the objects fetched.
+    """
+    def __init__(self, object_list, number, paginator, more=None):
+        super(ApproximatePage, self).__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        if self.more is None:
+            return super(ApproximatePage, self).has_next()
+        return self.more
+
+class ApproximatePaginator(Paginator):
+    """A Paginator which doesn't run an exact COUNT(*) on large querysets.
+
+    The count comes from approximate_count and "exact" tells whether it can
+    be trusted. If it can't, pages past the count can still be reached.
+    """
+    @cached_property
+    def _counted(self):
+        if not isinstance(self.object_list, QuerySet):
+            return Paginator.count.func(self), True
+        return approximate_count(self.object_list)
+
+    @property
+    def count(self):
+        return self._counted[0]
+
+    @property
+    def exact(self):
+        return self._counted[1]
+
+    def validate_number(self, number):
+        if self.exact:
+            return super(ApproximatePaginator, self).validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if self.exact:
+            return super(ApproximatePaginator, self).page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        return self._get_page(object_list[:self.per_page], number, self, len(object_list) > self.per_page)
+
+    def _get_page(self, *args, **kwargs):
+        return ApproximatePage(*args, **kwargs)
+
+def paginate_request(request, object_list, per_page=10, keyset=False, approximate=False, page=None):
+    """Returns the paginator and the page of object_list asked by request.
+
+    In keyset mode, querysets are paginated on their ordering plus pk, by the
+    "cursor" parameter; orderings unfit for keysets fall back to offsets.
+    Otherwise the "page" parameter (or page) is used and, if approximate is
+    True, the count comes from approximate_count. Invalid pages give the
+    first or the last page.
+    """
+    if keyset and isinstance(object_list, QuerySet):
+        try:
+            paginator = KeysetPaginator(object_list, per_page)
+        except ValueError:
+            pass
+        else:
+            try:
+                return paginator, paginator.page(request.GET.get('cursor', None))
+            except InvalidCursor:
+                return paginator, paginator.page()
+
+    paginator = (ApproximatePaginator if approximate else Paginator)(object_list, per_page)
+    number = request.GET.get('page', page or 1)
+    try:
+        return paginator, paginator.page(number)
+    except PageNotAnInteger:
+        return paginator, paginator.page(1)
+    except EmptyPage:
+        try:
+            return paginator, paginator.page(paginator.num_pages)
+        except EmptyPage:
+            return paginator, paginator.page(1)
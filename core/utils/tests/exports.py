@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+import io
+import zipfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from core.utils.exports import *
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.formula = '=HYPERLINK("http://example.com","x")'
+        User.objects.create(username="export", first_name=self.formula, last_name="-1+2")
+        self.queryset = User.objects.filter(username="export")
+        self.fields = ["username", "first_name", "last_name"]
+
+    def test_csv_formula(self):
+        response = export_response(self.queryset, 'csv', fields=self.fields)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('"\'=HYPERLINK(""http://example.com"",""x"")"', content)
+        self.assertIn("'-1+2", content)
+        self.assertNotIn(',=', content)
+
+    def test_csv_values(self):
+        rows = list(csv_stream([[-1, 2.5, '@SUM(A1)', '\tx', 'plain', '']]))
+        self.assertEqual(rows, ["-1,2.5,'@SUM(A1),'\tx,plain,\r\n"])
+
+    def test_xlsx_formula(self):
+        response = export_response(self.queryset, 'xlsx', fields=self.fields)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertNotIn('<f>', sheet)
+        self.assertIn('<c t="inlineStr"><is><t xml:space="preserve">=HYPERLINK("http://example.com","x")</t>', sheet)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from datetime import datetime
+
+from django.test import TestCase, RequestFactory, override_settings
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.contrib.auth.models import User, Permission
+from django.contrib.contenttypes.models import ContentType
+
+from core.utils import filter_objects
+from core.utils.filters import *
+
+NO_MATCH = Q(pk__in=[])
+
+def choice_field():
+    field = models.CharField(max_length=10, choices=(
+        ('TENTATIVE', 'tentative'),
+        ('CONFIRMED', 'confirmed'),
+        ('CANCELLED', 'cancelled'),
+    ))
+    field.set_attributes_from_name('status')
+    return field
+
+@override_settings(TIME_ZONE='UTC')
+class FieldFilterTestCase(TestCase):
+    def setUp(self):
+        self.users = {}
+        for username, joined in (
+            ("alice", datetime(2012, 5, 3, 10)),
+            ("alina", datetime(2012, 5, 31, 23, 59)),
+            ("bob", datetime(2012, 6, 1)),
+            ("carl", datetime(2013, 1, 1)),
+        ):
+            self.users[username] = User.objects.create(username=username, date_joined=timezone.make_aware(joined))
+
+    def usernames(self, name, value):
+        q = field_filter(User._meta.get_field(name), value)
+        return sorted(User.objects.filter(q).values_list('username', flat=True))
+
+    def test_text(self):
+        self.assertEqual(self.usernames('username', 'ali'), ['alice', 'alina'])
+        self.assertEqual(self.usernames('username', '=alice'), ['alice'])
+        self.assertEqual(self.usernames('username', '=ali'), [])
+        self.assertEqual(self.usernames('username', '~in'), ['alina'])
+        self.assertEqual(self.usernames('username', '  '), ['alice', 'alina', 'bob', 'carl'])
+
+    def test_number(self):
+        alice, bob = self.users['alice'].pk, self.users['bob'].pk
+        self.assertEqual(self.usernames('id', '%d' % bob), ['bob'])
+        self.assertEqual(self.usernames('id', '>%d' % bob), ['carl'])
+        self.assertEqual(self.usernames('id', '<= %d' % alice), ['alice'])
+        self.assertEqual(self.usernames('id', '%d..%d' % (alice, bob)), ['alice', 'alina', 'bob'])
+        self.assertEqual(self.usernames('id', '%d..' % bob), ['bob', 'carl'])
+
+    def periods(self):
+        self.assertEqual(self.usernames('date_joined', '2012'), ['alice', 'alina', 'bob'])
+        self.assertEqual(self.usernames('date_joined', '2012-05'), ['alice', 'alina'])
+        self.assertEqual(self.usernames('date_joined', '2012-12'), [])
+        self.assertEqual(self.usernames('date_joined', '2012-05-31'), ['alina'])
+        self.assertEqual(self.usernames('date_joined', '>2012-05'), ['bob', 'carl'])
+        self.assertEqual(self.usernames('date_joined', '<2012-06-01'), ['alice', 'alina'])
+        self.assertEqual(self.usernames('date_joined', '2012-05-04..2012-06'), ['alina', 'bob'])
+
+    def test_periods(self):
+        self.periods()
+        q = field_filter(User._meta.get_field('date_joined'), '2012')
+        self.assertEqual(q, Q(date_joined__gte=timezone.make_aware(datetime(2012, 1, 1)), date_joined__lt=timezone.make_aware(datetime(2013, 1, 1))))
+
+    def test_naive_periods(self):
+        with override_settings(USE_TZ=False):
+            self.periods()
+            q = field_filter(User._meta.get_field('date_joined'), '2012-12')
+            self.assertEqual(q, Q(date_joined__gte=datetime(2012, 12, 1), date_joined__lt=datetime(2013, 1, 1)))
+
+    def test_choice(self):
+        field = choice_field()
+        self.assertEqual(field_filter(field, 'CONFIRMED'), Q(status__in=['CONFIRMED']))
+        self.assertEqual(field_filter(field, 'Confirm'), Q(status__in=['CONFIRMED']))
+        self.assertEqual(field_filter(field, 'ten'), Q(status__in=['TENTATIVE']))
+        self.assertEqual(field_filter(field, 'c'), Q(status__in=['CONFIRMED', 'CANCELLED']))
+
+    def test_related(self):
+        field = Permission._meta.get_field('content_type')
+        self.assertEqual(field_filter(field, '3'), Q(content_type_id__in=[3]))
+        self.assertEqual(field_filter(field, '3, 5,'), Q(content_type_id__in=[3, 5]))
+        user_type = ContentType.objects.get_for_model(User)
+        permission_type = ContentType.objects.get_for_model(Permission)
+        Permission.objects.get_or_create(codename="filter_user", content_type=user_type)
+        Permission.objects.get_or_create(codename="filter_permission", content_type=permission_type)
+        q = field_filter(field, '%d' % user_type.pk)
+        self.assertEqual(set(Permission.objects.filter(q).values_list('content_type', flat=True)), set([user_type.pk]))
+        q = field_filter(field, '%d,%d' % (user_type.pk, permission_type.pk))
+        self.assertEqual(set(Permission.objects.filter(q).values_list('content_type', flat=True)), set([user_type.pk, permission_type.pk]))
+
+    def test_invalid(self):
+        self.assertEqual(field_filter(User._meta.get_field('id'), 'abc'), NO_MATCH)
+        self.assertEqual(field_filter(User._meta.get_field('id'), '>x'), NO_MATCH)
+        self.assertEqual(field_filter(User._meta.get_field('date_joined'), 'someday'), NO_MATCH)
+        self.assertEqual(field_filter(User._meta.get_field('date_joined'), '2012-13'), NO_MATCH)
+        self.assertEqual(field_filter(User._meta.get_field('is_staff'), 'maybe'), NO_MATCH)
+        self.assertEqual(field_filter(choice_field(), 'unknown'), NO_MATCH)
+        self.assertEqual(field_filter(Permission._meta.get_field('content_type'), '1,a'), NO_MATCH)
+        self.assertEqual(self.usernames('id', 'abc'), [])
+
+class FilterObjectsTestCase(TestCase):
+    def setUp(self):
+        for username in ("alice", "alina", "bob", "carl"):
+            User.objects.create(username=username)
+        self.factory = RequestFactory()
+
+    def test_sliced(self):
+        request = self.factory.post('/', {'filter_field': 'username', 'filter_query': 'ali'})
+        queryset = User.objects.order_by('username')[:3]
+        with self.assertNumQueries(1):
+            fields, values, matches = filter_objects(request, queryset)
+        self.assertNotIn("LIMIT", str(matches.query))
+        self.assertEqual(sorted(matches.values_list('username', flat=True)), ["alice", "alina"])
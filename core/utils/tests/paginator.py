@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from django.test import TestCase, RequestFactory
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.contrib.auth.models import User
+
+from core.utils.paginator import *
+from core.templatetags.navigator import index_of, next_object, prev_object
+from core.templatetags.paginator import paginate
+
+class KeysetNavigationTestCase(TestCase):
+    def setUp(self):
+        # Ties on first_name are broken by pk.
+        self.users = [
+            User.objects.create(username="user%d" % i, first_name=name)
+            for i, name in enumerate(["b", "a", "b", "a", "c", "b"])
+        ]
+        self.queryset = User.objects.filter(username__startswith="user").order_by("first_name")
+        self.expected = sorted(self.users, key=lambda u: (u.first_name, u.pk))
+
+    def test_neighbor(self):
+        paginator = KeysetPaginator(self.queryset, 1)
+        for previous, obj, following in zip(self.expected, self.expected[1:], self.expected[2:]):
+            self.assertEqual(paginator.neighbor(obj), following)
+            self.assertEqual(paginator.neighbor(obj, backward=True), previous)
+        self.assertEqual(paginator.neighbor(self.expected[-1]), None)
+        self.assertEqual(paginator.neighbor(self.expected[0], backward=True), None)
+        self.assertEqual(paginator.first(), self.expected[0])
+        self.assertEqual(paginator.last(), self.expected[-1])
+
+    def test_position(self):
+        paginator = KeysetPaginator(self.queryset, 1)
+        for i, obj in enumerate(self.expected):
+            self.assertEqual(paginator.position(obj), i + 1)
+
+    def test_descending_neighbor(self):
+        paginator = KeysetPaginator(self.queryset.order_by("-first_name"), 1)
+        expected = sorted(self.users, key=lambda u: (u.first_name, u.pk), reverse=True)
+        self.assertEqual(paginator.neighbor(expected[0]), expected[1])
+        self.assertEqual(paginator.position(expected[2]), 3)
+
+    def test_unfit_orderings(self):
+        for queryset in (
+            self.queryset.order_by(Lower("username")),
+            self.queryset.order_by(F("username").desc()),
+            self.queryset.order_by("?"),
+        ):
+            self.assertRaises(ValueError, KeysetPaginator, queryset)
+
+    def test_navigator_fallback(self):
+        queryset = self.queryset.order_by(Lower("first_name"), "pk")
+        obj = self.expected[2]
+        self.assertEqual(index_of(queryset, obj), 3)
+        self.assertEqual(next_object(queryset, obj), self.expected[3])
+        self.assertEqual(prev_object(queryset, obj), self.expected[1])
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(username="user%d" % i, first_name=name)
+            for i, name in enumerate(["b", "a", "b", "a", "c", "b", "a"])
+        ]
+        self.queryset = User.objects.filter(username__startswith="user").order_by("first_name")
+        self.expected = sorted(self.users, key=lambda u: (u.first_name, u.pk))
+
+    def walk(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].next_cursor:
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward(self):
+        pages = self.walk(KeysetPaginator(self.queryset, 3))
+        self.assertEqual([list(p) for p in pages], [self.expected[:3], self.expected[3:6], self.expected[6:]])
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[0].has_next())
+        self.assertTrue(pages[-1].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_backward(self):
+        paginator = KeysetPaginator(self.queryset, 3)
+        page = self.walk(paginator)[-1]
+        pages = [page]
+        while pages[-1].previous_cursor:
+            pages.append(paginator.page(pages[-1].previous_cursor))
+        self.assertEqual([list(p) for p in pages], [self.expected[6:], self.expected[3:6], self.expected[:3]])
+        self.assertFalse(pages[-1].has_previous())
+        self.assertTrue(pages[-1].has_next())
+
+    def test_ties(self):
+        # Every row is reached exactly once, even one row at a time among
+        # rows sharing the same first_name.
+        pages = self.walk(KeysetPaginator(self.queryset, 1))
+        self.assertEqual([p[0] for p in pages], self.expected)
+        pages = self.walk(KeysetPaginator(self.queryset.order_by("-first_name"), 2))
+        self.assertEqual(sum([list(p) for p in pages], []), sorted(self.users, key=lambda u: (u.first_name, u.pk), reverse=True))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(self.queryset, 3)
+        cursor = paginator.page().next_cursor
+        tampered = cursor[:-1] + ("A" if cursor[-1] != "A" else "B")
+        forged = signing.dumps(["n", [1]], salt="other")
+        short = signing.dumps(["n", ["a"]], salt=CURSOR_SALT, compress=True)
+        for cursor in ("garbage", tampered, forged, short):
+            self.assertRaises(InvalidCursor, paginator.page, cursor)
+
+    def test_request(self):
+        request = RequestFactory().get("/", {"cursor": "garbage"})
+        paginator, page = paginate_request(request, self.queryset, 3, keyset=True)
+        self.assertTrue(paginator.keyset)
+        self.assertEqual(list(page), self.expected[:3])
+        request = RequestFactory().get("/", {"cursor": page.next_cursor})
+        paginator, page = paginate_request(request, self.queryset, 3, keyset=True)
+        self.assertEqual(list(page), self.expected[3:6])
+
+    def test_unfit_ordering_tag(self):
+        context = {"request": RequestFactory().get("/", {"page": 2})}
+        queryset = self.queryset.order_by(Lower("first_name"), "pk")
+        paginate(context, queryset, 3, keyset=True)
+        self.assertFalse(getattr(context["paginator"], "keyset", False))
+        self.assertEqual(list(context["object_list"]), self.expected[3:6])
+
+class ApproximateCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(7):
+            User.objects.create(username="user%d" % i)
+        self.queryset = User.objects.filter(username__startswith="user").order_by("pk")
+
+    def test_approximate_count(self):
+        self.assertEqual(approximate_count(self.queryset), (7, True))
+        User.objects.create(username="user7")
+        # Without planner estimates, the count is cached and not exact any more.
+        if estimated_count(self.queryset) is None:
+            self.assertEqual(approximate_count(self.queryset), (7, False))
+
+    def test_inexact_pages(self):
+        approximate_count(self.queryset)
+        for i in range(7, 10):
+            User.objects.create(username="user%d" % i)
+        paginator = ApproximatePaginator(self.queryset, 3)
+        if paginator.exact:
+            return
+        self.assertEqual(paginator.count, 7)
+        page = paginator.page(3)
+        self.assertEqual([u.username for u in page], ["user6", "user7", "user8"])
+        self.assertTrue(page.has_next())
+        page = paginator.page(4)
+        self.assertEqual([u.username for u in page], ["user9"])
+        self.assertFalse(page.has_next())
+
+    def test_request(self):
+        request = RequestFactory().get("/", {"page": "x"})
+        paginator, page = paginate_request(request, self.queryset, 3, approximate=True)
+        self.assertIsInstance(paginator, ApproximatePaginator)
+        self.assertEqual(page.number, 1)
+        request = RequestFactory().get("/", {"page": 99})
+        paginator, page = paginate_request(request, self.queryset, 3, approximate=True)
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page), 1)
@@ -25,7 +25,10 @@ from django.views.generic import list_detail
 from django.utils.translation import check_for_language, activate
 from django.conf import settings
 
-from core.utils import filter_objects
+from core.utils import filter_objects, plan_related, table_fields
+from core.utils.exports import EXPORT_FORMATS, export_response
+from core.utils.paginator import paginate_request
+from core.authorize.managers import visible_to
 
 def set_language(request, lang, next=None):
     """Sets the current language.
@@ -43,8 +46,15 @@ def set_language(request, lang, next=None):
     activate(lang)
     return response
 
-def filtered_list_detail(request, model_or_queryset, fields=[], exclude=[], page=0, paginate_by=10, **kwargs):
+def filtered_list_detail(request, model_or_queryset, fields=[], exclude=[], page=0, paginate_by=10, perm=None, keyset=False, approximate=False, **kwargs):
     """Returns a filtered list of given objects.
+
+    If perm is given, only the objects on which the current user has perm
+    are listed. With an "export" parameter set to "csv" or "xlsx", the whole
+    filtered list is streamed as a file instead.
+
+    keyset and approximate choose how the list is paginated, like in the
+    paginate templatetag.
     """
     field_names, filter_fields, object_list = filter_objects(
         request,
@@ -53,12 +63,31 @@ def filtered_list_detail(request, model_or_queryset, fields=[], exclude=[], page
         exclude=exclude
     )
 
+    if perm:
+        object_list = visible_to(object_list, request.user, perm)
+
+    export = request.GET.get('export', request.POST.get('export'))
+    if export in EXPORT_FORMATS:
+        return export_response(object_list, export, fields=fields, exclude=exclude)
+
+    object_list = plan_related(object_list, table_fields(object_list.model, fields, exclude))
+
     extra_context = kwargs.pop('extra_context', {})
     extra_context.update({
         'field_names': field_names,
         'filter_fields': filter_fields,
     })
 
+    if paginate_by and (keyset or approximate):
+        paginator, page_obj = paginate_request(request, object_list, paginate_by, keyset, approximate, page)
+        extra_context.update({
+            'paginator': paginator,
+            'page_obj': page_obj,
+            'is_paginated': page_obj.has_other_pages(),
+            'object_list': page_obj.object_list,
+        })
+        paginate_by = None
+
     return list_detail.object_list(
         request,
         queryset=object_list,
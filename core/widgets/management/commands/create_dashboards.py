@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+from django.apps import apps
+
+from core.utils import bulk_provide
+from core.widgets.models import Widget
+from core.widgets.signals import managed_dashboard_models
+
+class Command(BaseCommand):
+    help = "Creates the missing dashboards of all the objects with a managed dashboard."
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help="Restricts the creation to the given models.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of objects updated at once.")
+
+    def handle(self, *args, **options):
+        models = managed_dashboard_models
+        if options['models']:
+            try:
+                models = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+
+        for model in models:
+            count = bulk_provide(
+                model,
+                "dashboard",
+                "%s_%d_dashboard",
+                defaults={"description": _("Dashboard")},
+                clear=lambda regions: Widget.objects.filter(region__in=regions).delete(),
+                batch_size=options['batch_size']
+            )
+            self.stdout.write("%s: %d dashboard(s) created." % (model._meta.label, count))
@@ -23,14 +23,23 @@ __version__ = '0.0.5'
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from core.utils import provide_lazily, peek_relation, save_relation
+
 from .models import *
 
+managed_dashboard_models = []
+
 ## UTILS ##
 
 def manage_dashboard(cls):
     """Connects handlers for dashboard management.
+
+    Dashboards are created the first time they're accessed. Use the
+    create_dashboards command to create them in bulk for existing objects.
     """
-    models.signals.post_save.connect(create_dashboard, cls)
+    if cls not in managed_dashboard_models:
+        managed_dashboard_models.append(cls)
+    provide_lazily(cls, "dashboard", create_dashboard)
     models.signals.post_delete.connect(delete_dashboard, cls)
 
 ## HANDLERS ##
@@ -41,14 +50,13 @@ def create_dashboard(sender, instance, *args, **kwargs):
     if hasattr(instance, "dashboard") and not instance.dashboard:
         instance.dashboard, is_new = Region.objects.get_or_create(slug="%s_%d_dashboard" % (sender.__name__.lower(), instance.pk), description=_("Dashboard"))
         if not is_new:
-            for w in instance.dashboard.widgets.all():
-                w.delete()
-        instance.save()
+            instance.dashboard.widgets.all().delete()
+        save_relation(instance, "dashboard")
 
 def delete_dashboard(sender, instance, *args, **kwargs):
     """Deletes the dashboard of the given object.
     """
-    dashboard = instance.dashboard
+    dashboard = peek_relation(instance, "dashboard")
     if dashboard:
         dashboard.delete()
         instance.dashboard = None
@@ -37,14 +37,8 @@ from .models import *
 def update_assignee_permissions(sender, instance, *args, **kwargs):
     """Updates the permissions of the assignee of the given partner.
     """
-    can_view_this_partner, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_partner", "partners", "partner", instance.pk)
-    can_change_this_partner, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_partner", "partners", "partner", instance.pk)
-    can_delete_this_partner, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_partner", "partners", "partner", instance.pk)
-
     if instance.assignee:
-        can_view_this_partner.users.add(instance.assignee)
-        can_change_this_partner.users.add(instance.assignee)
-        can_delete_this_partner.users.add(instance.assignee)
+        ObjectPermission.objects.grant(["view_partner", "change_partner", "delete_partner"], [instance], users=[instance.assignee])
 
 ## CONNECTIONS ##
 
@@ -39,26 +39,14 @@ def update_manager_permissions(sender, instance, *args, **kwargs):
     """
     model_name = sender.__name__.lower()
 
-    can_view_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_%s" % model_name, "projects", model_name, instance.pk)
-    can_change_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_%s" % model_name, "projects", model_name, instance.pk)
-    can_delete_this_object, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_%s" % model_name, "projects", model_name, instance.pk)
-
     if instance.manager:
-        can_view_this_object.users.add(instance.manager)
-        can_change_this_object.users.add(instance.manager)
-        can_delete_this_object.users.add(instance.manager)
+        ObjectPermission.objects.grant(["view_%s" % model_name, "change_%s" % model_name, "delete_%s" % model_name], [instance], users=[instance.manager])
 
 def update_assignee_permissions(sender, instance, *args, **kwargs):
     """Updates the permissions of the assignee of the given ticket.
     """
-    can_view_this_ticket, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_ticket", "projects", "ticket", instance.pk)
-    can_change_this_ticket, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_ticket", "projects", "ticket", instance.pk)
-    can_delete_this_ticket, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_ticket", "projects", "ticket", instance.pk)
-
-    if instance.manager:
-        can_view_this_ticket.users.add(instance.assignee)
-        can_change_this_ticket.users.add(instance.assignee)
-        can_delete_this_ticket.users.add(instance.assignee)
+    if instance.assignee:
+        ObjectPermission.objects.grant(["view_ticket", "change_ticket", "delete_ticket"], [instance], users=[instance.assignee])
 
 def link_project_stream(sender, instance, **kwargs):
     """Links the given stream to the parent project's one.
@@ -75,13 +63,13 @@ def link_milestone_stream(sender, instance, **kwargs):
 ## CONNECTIONS ##
 
 post_save.connect(update_author_permissions, Project, dispatch_uid="update_project_permissions")
-post_save.connect(update_manager_permissions, Project, dispatch_uid="update_project_permissions")
+post_save.connect(update_manager_permissions, Project, dispatch_uid="update_project_manager_permissions")
 
 post_save.connect(update_author_permissions, Milestone, dispatch_uid="update_milestone_permissions")
-post_save.connect(update_manager_permissions, Milestone, dispatch_uid="update_milestone_permissions")
+post_save.connect(update_manager_permissions, Milestone, dispatch_uid="update_milestone_manager_permissions")
 
 post_save.connect(update_author_permissions, Ticket, dispatch_uid="update_ticket_permissions")
-post_save.connect(update_assignee_permissions, Ticket, dispatch_uid="update_ticket_permissions")
+post_save.connect(update_assignee_permissions, Ticket, dispatch_uid="update_ticket_assignee_permissions")
 
 post_save.connect(notify_object_created, Project, dispatch_uid="project_created")
 post_change.connect(notify_object_changed, Project, dispatch_uid="project_changed")
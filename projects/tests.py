@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This file is part of the prometeo project.
+
+This program is free software: you can redistribute it and/or modify it 
+under the terms of the GNU Lesser General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your
+option) any later version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+
+__author__ = 'Emanuele Bertoldi <emanuele.bertoldi@gmail.com>'
+__copyright__ = 'Copyright (c) 2011 Emanuele Bertoldi'
+__version__ = '0.0.5'
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+
+from .models import Project, Ticket
+
+@override_settings(AUTHENTICATION_BACKENDS=[
+    'django.contrib.auth.backends.ModelBackend',
+    'core.authorize.backends.ObjectPermissionBackend',
+])
+class TicketPermissionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username="author")
+        self.assignee = User.objects.create(username="assignee")
+        self.project = Project(code="project", title="Project")
+        self.project.save()
+
+    def ticket(self, **kwargs):
+        ticket = Ticket(project=self.project, title="Ticket", description="Ticket", author=self.author, **kwargs)
+        ticket.save()
+        return ticket
+
+    def test_assignee(self):
+        ticket = self.ticket(assignee=self.assignee)
+        assignee = User.objects.get(pk=self.assignee.pk)
+        self.assertTrue(assignee.has_perm("projects.view_ticket", ticket))
+        self.assertTrue(assignee.has_perm("projects.change_ticket", ticket))
+        self.assertTrue(assignee.has_perm("projects.delete_ticket", ticket))
+
+    def test_reassigned(self):
+        ticket = self.ticket()
+        self.assertFalse(User.objects.get(pk=self.assignee.pk).has_perm("projects.change_ticket", ticket))
+        ticket.assignee = self.assignee
+        ticket.save()
+        self.assertTrue(User.objects.get(pk=self.assignee.pk).has_perm("projects.change_ticket", ticket))
@@ -60,6 +60,21 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# Permission indexes, notification counters and stream links are cached and
+# invalidated through this cache. The local-memory backend is only fit for a
+# single process: with several workers, use a shared backend (e.g.
+# 'django.core.cache.backends.redis.RedisCache' or memcached) so that every
+# worker sees the invalidations.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -37,19 +37,13 @@ from .models import *
 def update_manager_permissions(sender, instance, *args, **kwargs):
     """Updates the permissions assigned to the manager of the given warehouse.
     """
-    can_view_this_warehouse, is_new = ObjectPermission.objects.get_or_create_by_natural_key("view_warehouse", "stock", "warehouse", instance.pk)
-    can_change_this_warehouse, is_new = ObjectPermission.objects.get_or_create_by_natural_key("change_warehouse", "stock", "warehouse", instance.pk)
-    can_delete_this_warehouse, is_new = ObjectPermission.objects.get_or_create_by_natural_key("delete_warehouse", "stock", "warehouse", instance.pk)
-
     if instance.manager:
-        can_view_this_warehouse.users.add(instance.manager)
-        can_change_this_warehouse.users.add(instance.manager)
-        can_delete_this_warehouse.users.add(instance.manager)
+        ObjectPermission.objects.grant(["view_warehouse", "change_warehouse", "delete_warehouse"], [instance], users=[instance.manager])
 
 ## CONNECTIONS ##
 
 post_save.connect(update_author_permissions, Warehouse, dispatch_uid="update_warehouse_permissions")
-post_save.connect(update_manager_permissions, Warehouse, dispatch_uid="update_warehouse_permissions")
+post_save.connect(update_manager_permissions, Warehouse, dispatch_uid="update_warehouse_manager_permissions")
 post_save.connect(update_author_permissions, Movement, dispatch_uid="update_movement_permissions")
 post_save.connect(update_author_permissions, DeliveryNote, dispatch_uid="update_deliverynote_permissions")
 
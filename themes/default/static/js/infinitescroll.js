@@ -0,0 +1,30 @@
+$(document).ready(function() {
+
+    function loadMore(link) {
+        var url = link.data("feed");
+        link.removeData("feed").removeAttr("data-feed");
+        $.getJSON(url, function(data) {
+            link.siblings("dl.activities").append(data.html);
+            if (data.next) {
+                link.attr("data-feed", data.next).data("feed", data.next);
+            } else {
+                link.remove();
+            }
+        });
+    }
+
+    $("a.more[data-feed]").live("click", function(e) {
+        e.preventDefault();
+        if ($(this).data("feed")) {
+            loadMore($(this));
+        }
+    });
+
+    $(window).scroll(function() {
+        if ($(window).scrollTop() + $(window).height() >= $(document).height() - 200) {
+            $("a.more[data-feed]").each(function() {
+                loadMore($(this));
+            });
+        }
+    });
+});